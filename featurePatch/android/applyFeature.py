@@ -1,16 +1,43 @@
-import sys
 import traceback
 from typing import Callable
 import diff_match_patch as dmp_module
 from .util import target_code_folder, target_drawable_folder, target_string_folder, target_layout_folder
 from .util import src_drawable_folder, src_string_folder, src_layout_folder, src_code_folder, manifest_path
-from ..util import runtime_record_path, error_record_path, log, configuration, constants, find_separator, DiffList, path_diff
-from ..git import execute, _checkout_unmodified_file, unmodified_file_path
+from ..util import log, configuration, constants, find_separator, DiffList, path_diff, error_record_path, \
+    merge_cost_model_path, _inject_config, _inject_constants
+from .. import records
+from .. import mergecache
+from .. import costmodel
+from ..git import unmodified_file_content, prefetch_unmodified_files, stop_blob_fetcher, \
+    unchanged_upstream_files, stage_files
+from ..discovery import candidate_files
+from ..scan import marker_index_entry, pure_copy_pattern
+from ..fileops import copy_file, copy_destination
+from ..fingerprint import content_hash
+from ..fuzzy import first_fuzzy_matches
+from ..lines import marker_lines, intern_lines, decode_diff
+from .. import diff3
+from .valuesMerge import merge_values
+from ..chunks import chunked_diff
 import os
-import json
 import re
-from fuzzywuzzy import fuzz
-from plumbum import local
+import shutil
+import time
+import multiprocessing
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+
+# Merge engines, selected with the 'merge_engine' constant
+DMP_ENGINE = "dmp"
+DIFF3_ENGINE = "diff3"
+
+# Lines framing a region that upstream and the feature both changed (@see _diff3_merge)
+CONFLICT_START = "<<<<<<< upstream\n"
+CONFLICT_SEPARATOR = "=======\n"
+CONFLICT_END = ">>>>>>> feature\n"
+
+# Absolute end of the time budget of the running patch, None if unlimited (@see _diff_budget)
+patch_deadline: float = None
 
 
 def _match_files(contact_point_subrepo: str, container_dir: str):
@@ -21,34 +48,38 @@ def _match_files(contact_point_subrepo: str, container_dir: str):
     :param container_dir: corresponding folder in the container repository
     :param runtime_log: path to runtime log file
     """
-    for dirpath, _, filenames in os.walk(contact_point_subrepo):
-        for filename in filenames:
-            subrepo_filepath = os.path.join(dirpath, filename)
-            log.debug(f'subrepo_filepath: \n{subrepo_filepath}')
-            log.debug(f'subrepo_dir: \n{contact_point_subrepo}')
-            diff = path_diff(subrepo_filepath, contact_point_subrepo)
-            log.debug(f'diff: \n{diff}')
-            container_match = os.path.join(container_dir, diff)
-            log.debug(f'container_match: \n{container_match}')
-            if os.path.isfile(container_match):
+    for subrepo_filepath in candidate_files(contact_point_subrepo):
+        (dirpath, filename) = os.path.split(subrepo_filepath)
+        log.debug(f'subrepo_filepath: \n{subrepo_filepath}')
+        log.debug(f'subrepo_dir: \n{contact_point_subrepo}')
+        diff = path_diff(subrepo_filepath, contact_point_subrepo)
+        log.debug(f'diff: \n{diff}')
+        container_match = os.path.join(container_dir, diff)
+        log.debug(f'container_match: \n{container_match}')
+        if os.path.isfile(container_match):
+            _write_runtime_record(filename, subrepo_filepath, container_match)
+        else:
+            # Check if the file is a pure-copy file => Markers on two adjacent lines without content inbetween
+            if _is_pure_copy(subrepo_filepath):
+                container_match = os.path.join(container_dir, ".")
                 _write_runtime_record(filename, subrepo_filepath, container_match)
             else:
-                # Check if the file is a pure-copy file => Markers on two adjacent lines without content inbetween
-                with open(os.path.join(dirpath, filename), "r", encoding="utf-8") as f:
-                    content = f.read()
-                marker = configuration()["marker"]
-                # '$^' makes sure that there is no content between the markers indicating that the entire file should be copied
-                #               Java-style comments
-                p = rf"{marker}\s*start\s*$\n^\s*//{marker}\s*end|" \
-                    rf"{marker}\s*start\s*-->\s*$\n^\s*<!--\s*{marker}\s*end" # XML comments
-                found_match = re.search(p, content, re.MULTILINE)
-                if found_match:
-                    container_match = os.path.join(container_dir, ".")
-                    _write_runtime_record(filename, subrepo_filepath, container_match)
-                else:
-                    _write_error(
-                        f"ERROR: {filename} was not found in container repository and {filename} is not a pure-copy file, please check this file manually.",
-                        subrepo_filepath, log.error)
+                _write_error(
+                    f"ERROR: {filename} was not found in container repository and {filename} is not a pure-copy file, please check this file manually.",
+                    subrepo_filepath, log.error)
+
+
+def _is_pure_copy(contact_point_path: str):
+    """
+    Uses the marker index written during extraction, parses the file only if it is unknown to the index.
+    :return: True if the file contains a marker 'start' directly followed by a marker 'end'
+    """
+    entry = marker_index_entry(contact_point_path)
+    if entry is not None:
+        return entry["pure_copy"]
+    with open(contact_point_path, "r", encoding="utf-8") as f:
+        content = f.read()
+    return re.search(pure_copy_pattern(configuration()["marker"]), content, re.MULTILINE) is not None
 
 
 def _write_runtime_record(filename, filepath, match):
@@ -66,22 +97,7 @@ def _write_runtime_record(filename, filepath, match):
         log.info(m.group(0))
     else:
         log.info(f"Found matching {filename}!")
-    with open(runtime_record_path(), 'a') as f:
-        f.write(f"\n{_format_runtime_task(filepath, match)},")
-
-
-def _format_runtime_task(subrepo_file: str, matching_container_file: str = None):
-    """
-    defines the format of the runtime or error dictionary as json string.
-    runtime if both paths are given or pure-copy, error otherwise.
-    uses Json formatting
-    :return: a Json formatted python dictionary
-    """
-    element = dict()
-    element["contact_point"] = subrepo_file
-    element["match"] = "" if matching_container_file is None else matching_container_file
-    element["processed"] = False
-    return json.dumps(element)
+    records.add_record(filepath, match)
 
 
 def _write_error(log_msg: str, filepath: str, logfunction: Callable[[str], None]):
@@ -94,8 +110,7 @@ def _write_error(log_msg: str, filepath: str, logfunction: Callable[[str], None]
     """
     assert logfunction == log.error or logfunction == log.critical or logfunction == log.warning, "Precondition violated! logfunction must be error, critical or warning."
     logfunction(log_msg)
-    with open(error_record_path(), 'a') as f:
-        f.write(f"{_format_runtime_task(filepath)},\n")
+    records.add_error(filepath, log_msg)
 
 
 def match():
@@ -104,10 +119,7 @@ def match():
      Record if you cannot match a file and save the matched pairs + status indicator in the runtime_record.
     :return:
     """
-    for path in [runtime_record_path, error_record_path]:
-        # truncate or create file
-        with open(path(), "w") as f:
-            f.write("[")# Initiate Json Array Literal
+    records.reset_store()
 
     # go through all folders and create matchings
     log.info("###\n# Checking code folder...\n###\n")
@@ -132,24 +144,12 @@ def match():
             # Assume pure copy file for all of these. TODO: Is this assumption correct?
             _write_runtime_record(filepath.split(sep)[-1], filepath, os.path.join(*targets[idx].split(sep)[0:-1], '.'))
 
-
-
-    # Close Json Array Literal
-    for path in [runtime_record_path, error_record_path]:
-        with open(path(), "r+", encoding="utf-8") as f:
-            content = f.read()
-            if content == "[\n":
-                if path == runtime_record_path:
-                    log.critical("No matches found, cannot proceed. Is the correct branch checked out?")
-                    exit(1)
-                else:
-                    content = content + "]"
-            else:
-                content = content[:-1]
-                content = content + "\n]"
-            f.seek(0)
-            f.truncate()
-            f.write(content)
+    # All records are committed at once and written to the human readable json files
+    records.commit()
+    records.export_json()
+    if records.record_count() == 0:
+        log.critical("No matches found, cannot proceed. Is the correct branch checked out?")
+        exit(1)
 
 
 class MissmatchedMarkerError(Exception):
@@ -159,60 +159,188 @@ class MissmatchedMarkerError(Exception):
     pass
 
 
-def _generate_merged_content(match: str, contact_point: str, contact_point_path: str):
+def _merge_contents(match: str, contact_point: str, unmodified_match_text: str, marker_blocks: list,
+                    contact_point_path: str, values_file: bool = False):
     """
     Best effort merge of the contact point changes with the upgraded container file. Takes the
     unmodified container file (on which the contact point changes are based) into account.
+    Only works on the texts, it may run in a worker process of the patch (@see patch).
     :param match: The text of the matched file in the upgraded container repo.
     :param contact_point: The text of the contact point file.
+    :param unmodified_match_text: The text of the container file the contact point changes are based on.
+    :param marker_blocks: marker spans of the contact point as recorded in the marker index, parsed if None
     :param contact_point_path: The path to the contact point file.
-    :return: The merged text ready to be written to file.
+    :param values_file: True for the files of the string root, they are merged by key (@see valuesMerge) unless
+    they turn out not to be plain values files.
+    :return: (merged, fallbacks, cached) the merged text ready to be written to file, a description of every diff that
+    exceeded its time budget and of every conflict to review, and whether the result came from the merge cache.
+    Results are looked up in the merge cache first (@see featurePatch.mergecache).
     """
     # TODO: Will have to add corner cases as we see them and add them to the test repository
-    _checkout_unmodified_file(contact_point_path)
-    with open(unmodified_file_path(contact_point_path, configuration()["windows"]), "r", encoding="utf-8") as f:
-        unmodified_match_text = f.read()
-    return _create_diff(match, contact_point, unmodified_match_text)
-
-
-
-def _create_diff(upstream: str, modified_predecessor: str, unmodified_predecessor: str):
+    key = mergecache.cache_key(mergecache.VALUES if values_file else mergecache.MERGED,
+                               [match, contact_point, unmodified_match_text])
+    cached = mergecache.lookup(key)
+    if cached is not None:
+        log.info(f"Found the merged version of {os.path.basename(contact_point_path)} in the merge cache.")
+        return cached["merged"], [], True
+    fallbacks = []
+    merged = None
+    if values_file:
+        merged = merge_values(match, contact_point, unmodified_match_text, configuration()["marker"])
+        if merged is None:
+            log.info(f"{os.path.basename(contact_point_path)} is not a plain values file, merging it line by line.")
+    if merged is None:
+        merged = _create_diff(match, contact_point, unmodified_match_text, marker_blocks, fallbacks)
+    # results of diffs that ran out of time are not worth keeping, conflicts are reported on every patch
+    if len(fallbacks) == 0:
+        mergecache.store(key, {"merged": merged})
+    return merged, fallbacks, False
+
+
+def _create_diff(upstream: str, modified_predecessor: str, unmodified_predecessor: str, marker_blocks: list = None,
+                 fallbacks: list = None):
     """"
-        @see _generate_merged_content
+        @see _merge_contents
         this is refactored for unittesting
+    :param marker_blocks: marker spans of modified_predecessor as recorded in the marker index, parsed if None
     """
-    (diffs, intermediate) = _create_intermediate_diffs(upstream, modified_predecessor, unmodified_predecessor)
+    if _merge_engine() == DIFF3_ENGINE:
+        return _diff3_merge(upstream, modified_predecessor, unmodified_predecessor, marker_blocks, fallbacks)
+    (diffs, intermediate) = _create_intermediate_diffs(upstream, modified_predecessor, unmodified_predecessor,
+                                                       marker_blocks, fallbacks)
     # Take changes to upgrade into account and turn them into equalities
     diffs = _transform_diffs(intermediate, diffs)
     return dmp_module.diff_match_patch().diff_text2(diffs)
 
 
-def _create_intermediate_diffs(upstream: str, modified_predecessor: str, unmodified_predecessor: str):
+def _merge_engine():
+    """
+    :return: The configured merge engine, 'dmp' or 'diff3'
+    """
+    engine = constants()["merge_engine"]
+    if engine not in (DMP_ENGINE, DIFF3_ENGINE):
+        log.critical(f"Unknown merge_engine '{engine}', expected '{DMP_ENGINE}' or '{DIFF3_ENGINE}'.")
+        exit(1)
+    return engine
+
+
+def _diff3_merge(upstream: str, modified_predecessor: str, unmodified_predecessor: str, marker_blocks: list = None,
+                 fallbacks: list = None):
+    """
+    Three-way merge based on the unmodified predecessor (@see featurePatch.diff3).
+    Regions changed on one side only are taken from that side. Where upstream and the feature changed the same lines,
+    both versions are kept between conflict markers, like git does, the user has to resolve them.
+    :param fallbacks: if given, a description of every conflicting region is appended
+    :return: The merged text
+    """
+    (table, (base, ours, theirs)) = intern_lines(
+        [_marker_lines(unmodified_predecessor), _marker_lines(upstream),
+         _marker_lines(modified_predecessor, marker_blocks)])
+
+    def decode(codes: str):
+        return "".join(table[ord(c)] for c in codes)
+
+    merged = []
+    lines = 0
+    regions = diff3.merge_regions(base, ours, theirs)
+    for (kind, _, (ours_lo, ours_hi), (theirs_lo, theirs_hi)) in regions:
+        if kind == diff3.CONFLICT:
+            (upstream_side, feature_side) = (_terminated(decode(ours[ours_lo:ours_hi])),
+                                             _terminated(decode(theirs[theirs_lo:theirs_hi])))
+            text = CONFLICT_START + upstream_side + CONFLICT_SEPARATOR + feature_side + CONFLICT_END
+            last_line = lines + text.count("\n")
+            conflict = f"conflict at lines {lines + 1}-{last_line}, both versions kept between conflict markers"
+            log.warning(f"Upstream and the feature changed the same lines, {conflict}, please resolve:\n{text}")
+            if fallbacks is not None:
+                fallbacks.append(conflict)
+        elif kind == diff3.B:
+            text = decode(theirs[theirs_lo:theirs_hi])
+        else:
+            text = decode(ours[ours_lo:ours_hi])
+        merged.append(text)
+        lines += text.count("\n")
+    return "".join(merged)
+
+
+def _terminated(text: str):
+    """
+    :return: text ending with a line break unless it is empty, so the conflict markers stay on lines of their own
+    """
+    return text if text == "" or text.endswith("\n") else text + "\n"
+
+
+def _create_intermediate_diffs(upstream: str, modified_predecessor: str, unmodified_predecessor: str,
+                               marker_blocks: list = None, fallbacks: list = None):
     """"
-        @see _generate_merged_content
+        @see _merge_contents
         this is refactored for unittesting
+        All three texts share one line table (@see featurePatch.lines), upstream is only split once.
+        Every diff gets a time budget according to its size (@see _diff_budget).
+        The diff unmodified -> upstream is shared by all contact points of a container file, it is cached while
+        patching (@see featurePatch.mergecache).
     """
-    diffs = _compute_line_diff(upstream, modified_predecessor)
+    (table, (upstream_codes, modified_codes, unmodified_codes)) = intern_lines(
+        [_marker_lines(upstream), _marker_lines(modified_predecessor, marker_blocks),
+         _marker_lines(unmodified_predecessor)])
+    diffs = decode_diff(_line_diff(upstream_codes, modified_codes, fallbacks=fallbacks), table)
     # Match up any changed lines between unmodified and match and change these in diffs
-    intermediate = _compute_line_diff(unmodified_predecessor, upstream)
+    key = mergecache.cache_key(mergecache.INTERMEDIATE, [unmodified_predecessor, upstream])
+    cached = mergecache.lookup(key)
+    if cached is not None:
+        intermediate = [(op, text) for (op, text) in cached["diff"]]
+    else:
+        intermediate_fallbacks = []
+        intermediate = decode_diff(_line_diff(unmodified_codes, upstream_codes, fallbacks=intermediate_fallbacks),
+                                   table)
+        if len(intermediate_fallbacks) == 0:
+            mergecache.store(key, {"diff": intermediate})
+        if fallbacks is not None:
+            fallbacks.extend(intermediate_fallbacks)
     return (diffs, intermediate)
 
 
-def _compute_line_diff(text1: str, text2: str, deadline: float=None):
+def _diff_deadline():
+    """
+    :return: the configured per_file_diff_deadline or None
+    """
+    deadline = constants()["per_file_diff_deadline"]
+    return None if deadline == "None" else float(deadline)
+
+
+def _diff_budget(codes1: str, codes2: str):
+    """
+    Time budget of a line diff. Grows with the number of lines and with an estimate of the edit distance (the lines
+    that are not common to both texts, regardless of their order). It is capped by per_file_diff_deadline and by what
+    is left of the time budget of the patch (@see patch).
+    :return: (budget, limit) budget in [s], may be <= 0 if the patch ran out of time or the cap is 0. limit describes
+    the cap that set the budget, None if it was sized by the input alone.
+    """
+    const = constants()
+    (counts1, counts2) = (Counter(codes1), Counter(codes2))
+    edits = sum((counts1 - counts2).values()) + sum((counts2 - counts1).values())
+    budget = float(const["diff_budget_base"]) \
+        + float(const["diff_budget_per_kline"]) * (len(codes1) + len(codes2)) / 1000 \
+        + float(const["diff_budget_per_edit"]) * edits
+    limit = None
+    cap = _diff_deadline()
+    if cap is not None and cap < budget:
+        (budget, limit) = (cap, f"per_file_diff_deadline of {cap:g}s")
+    if patch_deadline is not None and patch_deadline - time.time() < budget:
+        (budget, limit) = (patch_deadline - time.time(), "time budget of the patch")
+    return budget, limit
+
+
+def _compute_line_diff(text1: str, text2: str, deadline: float=None, blocks1: list = None, blocks2: list = None):
     """
     pull the deadline out of the configs (if not provided) and pass onto line_diff
-    preprocesses text1 and text2 to treat anything between markers as immutable
+    treats anything between markers as immutable
+    :param deadline: time budget in [s], sized according to the input if None (@see _diff_budget)
+    :param blocks1: known marker spans of text1 (@see featurePatch.scan), text1 is parsed if None
+    :param blocks2: known marker spans of text2
     :return: line-level diff turning text1 into text2
     """
-    if deadline is None:
-        deadline = constants()["per_file_diff_deadline"]
-        deadline = None if deadline == "None" else float(deadline)
-    diff = _line_diff(_group_marker_content(text1), _group_marker_content(text2), deadline)
-    # undo any groupings
-    ungrouped_diff = []
-    for d in diff:
-        ungrouped_diff.append((d[0], _ungroup_marker_content(d[1])))
-    return ungrouped_diff
+    (table, (codes1, codes2)) = intern_lines([_marker_lines(text1, blocks1), _marker_lines(text2, blocks2)])
+    return decode_diff(_line_diff(codes1, codes2, deadline), table)
 
 
 def _transform_diffs(unrelated_diffs: DiffList, ti_related_diff: DiffList):
@@ -264,6 +392,15 @@ def _transform_diffs(unrelated_diffs: DiffList, ti_related_diff: DiffList):
     #(idx, (_, text)) as found in results
     unmatched_deletions = []
 
+    # Look up all fuzzy matches at once (@see featurePatch.fuzzy)
+    marker = configuration()['marker']
+    deletions = [dtext for (dt, dtext) in ti_related_diff if dt == tm['deletion'] and marker not in dtext]
+    insertions = [dtext for (dt, dtext) in ti_related_diff if dt == tm['insertion']]
+    unrelated_insertions = [dtext for (dt, dtext) in unrelated_diffs if dt == tm['insertion']]
+    unrelated_deletions = [dtext for (dt, dtext) in unrelated_diffs if dt == tm['deletion']]
+    deletion_matches = iter(first_fuzzy_matches(deletions, unrelated_insertions, min_fuzz_score, any_match=True))
+    insertion_matches = iter(first_fuzzy_matches(insertions, unrelated_deletions, min_fuzz_score, any_match=True))
+
     # because of ordering
     for d in ti_related_diff:
         diff_type = d[0]
@@ -271,23 +408,15 @@ def _transform_diffs(unrelated_diffs: DiffList, ti_related_diff: DiffList):
         if diff_type == tm['equality']:
             intermediate.append(d)
         elif diff_type == tm['deletion']:
-            if configuration()['marker'] not in diff_text:
-                match_found = False
-                for (dt, dtext) in unrelated_diffs:
-                    if dt == tm['insertion'] and fuzz.partial_ratio(dtext, diff_text) >= min_fuzz_score:
-                        match_found = True
-                        break # found the correct match, no need to keep iterating
+            if marker not in diff_text:
+                match_found = next(deletion_matches) is not None
                 if not match_found:
                     unmatched_deletions.append(diff_text)
                     log.warn(f'found a deletion without matching insertion: \n{diff_text}')
             # Turn deletion into equality
             intermediate.append((0, diff_text))
         elif diff_type == tm['insertion']:
-            match_found = False
-            for (dt, dtext) in unrelated_diffs:
-                if dt == tm['deletion'] and fuzz.partial_ratio(dtext, diff_text) >= min_fuzz_score:
-                    match_found = True
-                    break # found the correct match, no need to keep iterating
+            match_found = next(insertion_matches) is not None
             if not match_found:
                 intermediate.append((1, diff_text))
             # Else we simply ignore this insertion.
@@ -295,14 +424,13 @@ def _transform_diffs(unrelated_diffs: DiffList, ti_related_diff: DiffList):
         # (idx, (_, text)) as found in results
         fuzzy_matched_insertions = []
         # Try to find fuzzy matches with any insertion
-        for text in unmatched_deletions:
-            for (diff_type, diff_text) in intermediate:
-                if diff_type == 1:
-                    if fuzz.partial_ratio(text, diff_text) >= min_fuzz_score:
-                        fuzzy_matched_insertions.append((diff_type, diff_text))
-                        break # TODO: we only consider the first match, this could cause problems...
-                        # one option would be to find the insertion that is closest to the deletion or something
-                        # along these lines, but trying this for now and seeing if it's good enough
+        remaining_insertions = [diff_text for (diff_type, diff_text) in intermediate if diff_type == 1]
+        # TODO: we only consider the first match, this could cause problems...
+        # one option would be to find the insertion that is closest to the deletion or something
+        # along these lines, but trying this for now and seeing if it's good enough
+        for j in first_fuzzy_matches(unmatched_deletions, remaining_insertions, min_fuzz_score, query_first=True):
+            if j is not None:
+                fuzzy_matched_insertions.append((1, remaining_insertions[j]))
         # Remove all the fuzzy matched insertions from intermediate
         for fmi in fuzzy_matched_insertions:
             log.info(f"removed fuzzy insertion match for unmatched deletion:\n{fmi}")
@@ -321,27 +449,23 @@ def _transform_diffs(unrelated_diffs: DiffList, ti_related_diff: DiffList):
     return result
 
 
-def _group_marker_content(text: str):
+def _marker_lines(text: str, blocks: list = None):
+    """
+    @see featurePatch.lines.marker_lines
+    """
+    return marker_lines(text, configuration()['marker'], blocks)
+
+
+def _group_marker_content(text: str, blocks: list = None):
     """
     In order to make sure that the contents between the marker are treated as one immutable block, we concatenate
     the lines with ||<marker>|| that are inbetween the 'start' and 'end' markers. This way, this content is treated
-    as a single line when using dmp.diff_linesToChars
+    as a single line when diffing line by line
+    :param blocks: marker spans recorded during extraction (@see featurePatch.scan), the text is parsed if None
     :return: text with anything between the markers regrouped in a single line
     """
-    marker = configuration()['marker']
-    new_lines = []
-    grouping = None
-    for line in text.split("\n"):
-        if grouping is not None:
-            grouping = grouping + f"||{marker}||" + line
-            if marker in line and "end" in line:
-                new_lines.append(grouping)
-                grouping = None
-        elif marker in line and "start" in line:
-            grouping = line
-        else:
-            new_lines.append(line)
-    return "\n".join(new_lines)
+    separator = f"||{configuration()['marker']}||"
+    return "\n".join(line.replace("\n", separator) for line in _marker_lines(text, blocks))
 
 
 def _ungroup_marker_content(text: str):
@@ -352,59 +476,248 @@ def _ungroup_marker_content(text: str):
     return text.replace(f"||{configuration()['marker']}||", "\n")
 
 
-def _line_diff(text1: str, text2: str, deadline: float):
+def _line_diff(codes1: str, codes2: str, deadline: float = None, fallbacks: list = None):
     """
-    Pre: text1 and/or text2 have been passed through 'group_marker_content' if they contain marked content
-    :param deadline: timeconstraint for the diff in [s], may be None
-    :param do_log:
-    :return:
+    Pre: both texts have been interned into the same line table (@see featurePatch.lines)
+    :param codes1: line id sequence of the first text
+    :param codes2: line id sequence of the second text
+    :param deadline: timeconstraint for the diff in [s], sized according to the input if None (@see _diff_budget)
+    :param fallbacks: if given, a description is appended if the diff exceeded its time budget
+    Large inputs are split into small regions first (@see featurePatch.chunks).
+    When dmp runs out of time, it silently returns a coarse diff. Instead, the diff is redone with a patience diff
+    (@see featurePatch.diff3), which needs no time limit.
+    :return: line-level diff over the line ids
     """
-    dmp = dmp_module.diff_match_patch()
-    # Scan the text on a line-by-line basis
-    (text1, text2, linearray) = dmp.diff_linesToChars(text1, text2)
-
-    diffs = dmp.diff_main(text1, text2, False, deadline)
-
-    # Convert the diff back to original text.
-    dmp.diff_charsToLines(diffs, linearray)
-    #log.debug("line_diffs:\n" + print_all_diffs(diffs))
+    (budget, limit) = _diff_budget(codes1, codes2) if deadline is None else (deadline, f"deadline of {deadline:g}s")
+    lines = len(codes1) + len(codes2)
+    if budget <= 0:
+        fallback = f"patience diff, {limit} exhausted ({lines} lines)"
+        log.warning(f"No time left for the diff of {lines} lines ({limit} exhausted), using a patience diff instead.")
+        diffs = diff3.patience_diff(codes1, codes2)
+    else:
+        # dmp expects an absolute point in time
+        end = time.time() + budget
+        dmp = dmp_module.diff_match_patch()
+        if lines >= int(constants()["chunked_diff_min_lines"]):
+            diffs = chunked_diff(codes1, codes2, lambda region1, region2: dmp.diff_main(region1, region2, False, end))
+        else:
+            diffs = dmp.diff_main(codes1, codes2, False, end)
+        fallback = None
+        if time.time() > end:
+            fallback = f"patience diff, dmp exceeded its budget of {budget:.2f}s ({lines} lines)"
+            log.warning(f"The diff of {lines} lines exceeded its budget of {budget:.2f}s, using a patience diff "
+                        f"instead.")
+            diffs = diff3.patience_diff(codes1, codes2)
+    if fallback is not None and fallbacks is not None:
+        fallbacks.append(fallback)
     # Eliminate freak matches (e.g. blank lines)
     # dmp.diff_cleanupSemantic(diffs)
     # => This was resulting in diffs that were finer than line by line, so we consciously omit it.
     return diffs
 
 
-def patch():
-    # assume the entire record can be kept in memory
-    with open(runtime_record_path(), "r") as f:
-        records = json.load(f)
-    current_record = 0
-    while bool(records[current_record]["processed"]):
-        current_record += 1
-    while current_record < len(records):
-        try:
-            subrepo_path = records[current_record]["contact_point"]
-            container_path = records[current_record]["match"]
-            if re.search(r"\.$", container_path) is not None or re.search(r"/.$", container_path) is not None:
-                # Pure copy file, simply copy
-                execute(local["cp"][subrepo_path, container_path], do_log=False)
-                execute(local["git"]["add", container_path], do_log=False)
-                log.info(f"Copied {os.path.basename(subrepo_path)}...")
-            else:
-                log.info(f"Creating a merged version of {os.path.basename(subrepo_path)}...")
-                with open(container_path, "r", encoding="utf-8") as f:
-                    match = f.read()
-                with open(records[current_record]["contact_point"], "r", encoding="utf-8") as f:
-                    contact_point = f.read()
-                    new_content = _generate_merged_content(match, contact_point, records[current_record]["contact_point"])
-                    with open(container_path, "w", encoding="utf-8") as f:
-                        f.write(new_content)
-        except Exception as e:
-            _write_error(f"{sys.last_type, traceback.format_exception(e)}\n", records[current_record]["match"], log.critical)
-            exit(1)
-        finally:
-            # Write the updated record to file after each iteration
-            records[current_record]["processed"] = True
-            with open(runtime_record_path(), "w") as f:
-                f.write(json.dumps(records, indent=1))
-            current_record = current_record + 1
+def patch(jobs: int = 1):
+    """
+    Patches all unprocessed records of the record store, resuming after the last processed record.
+    Progress is journaled (@see featurePatch.records) and compacted into the runtime record once at the end.
+    A file that cannot be patched is recorded as an error, the patch goes on with the next file and exits with an
+    error once all files are done.
+    :param jobs: number of worker processes for the merges. The main process still does all git operations, reads
+    and writes the files and updates the records. The copies are done first in order. With a single job, the merges
+    run one after the other in record order. With several jobs, they are started longest first according to the
+    merge cost model (@see featurePatch.costmodel) and written in the order they were started.
+    Copies whose destination is already identical are skipped, all patched files are staged with a single 'git add'.
+    """
+    global patch_deadline
+    budget = constants()["patch_time_budget"]
+    patch_deadline = None if budget == "None" else time.time() + float(budget)
+    records.prepare_patch()
+    mergecache.open_cache()
+    pending = records.unprocessed_records()
+    unchanged_upstream = unchanged_upstream_files()
+    merge_records = [r for r in pending if not _is_copy_record(r)
+                     and os.path.normpath(r["match"]) not in unchanged_upstream]
+    model = costmodel.load_model(merge_cost_model_path())
+    pool = None
+    if jobs > 1 and len(merge_records) > 1:
+        order = costmodel.longest_first(model, [(_cost_key(r), [r["match"], r["contact_point"]])
+                                                for r in merge_records])
+        merge_records = [merge_records[i] for i in order]
+        # spawn, the blob fetcher threads must not be forked
+        pool = ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_merge_worker,
+                                   initargs=(configuration(), constants(), patch_deadline))
+    if constants()["prefetch_unmodified_files"]:
+        prefetch_unmodified_files([r["contact_point"] for r in merge_records])
+    merge_ids = {r["id"] for r in merge_records}
+    # all patched files are staged at once in the end
+    touched = []
+    failures = 0
+    try:
+        for record in pending:
+            if record["id"] in merge_ids:
+                continue
+            started = time.time()
+            try:
+                subrepo_path = record["contact_point"]
+                container_path = record["match"]
+                if copy_file(subrepo_path, container_path, skip_identical=True) == "identical":
+                    log.info(f"{os.path.basename(subrepo_path)} is already up to date...")
+                elif _is_copy_record(record):
+                    # Pure copy file
+                    log.info(f"Copied {os.path.basename(subrepo_path)}...")
+                else:
+                    # No upstream changes, the merge would result in the contact point
+                    log.info(f"Copied {os.path.basename(subrepo_path)}, the container file did not change upstream...")
+                touched.append(copy_destination(subrepo_path, container_path))
+                records.journal(record["id"], records.COPIED, started=started, duration=time.time() - started)
+            except Exception as e:
+                _record_failure(record, started, e)
+                failures += 1
+        for (record, started, merge) in _merges(merge_records, pool, 2 * jobs):
+            try:
+                (new_content, fallbacks, timing) = merge.result()
+                # the start of the merge has to be on disk before the file changes (@see records.compact_journal)
+                records.sync_journal()
+                _replace_file_content(record["match"], new_content)
+                touched.append(record["match"])
+                records.journal(record["id"], records.MERGED, started=started, duration=time.time() - started,
+                                fallback="; ".join(fallbacks) if fallbacks else None)
+                if timing is not None:
+                    costmodel.record_timing(model, _cost_key(record), *timing)
+            except Exception as e:
+                _record_failure(record, started, e)
+                failures += 1
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        records.compact_journal()
+        mergecache.close_cache()
+        costmodel.save_model(model, merge_cost_model_path(), {_cost_key(r) for r in merge_records})
+        stop_blob_fetcher()
+        stage_files(touched)
+    if failures > 0:
+        log.critical(f"{failures} files could not be patched, see {error_record_path()}.")
+        exit(1)
+
+
+def _record_failure(record, started: float, e: Exception):
+    error = "".join(traceback.format_exception(e))
+    _write_error(error, record["match"], log.critical)
+    records.journal(record["id"], records.FAILED, started=started, duration=time.time() - started, error=error)
+
+
+def _cost_key(record):
+    """
+    :return: key of the record in the merge cost model
+    """
+    return os.path.normpath(record["contact_point"])
+
+
+def _merges(merge_records: list, pool: ProcessPoolExecutor, window: int):
+    """
+    Starts the merges of the records in order and hands them out in that same order.
+    Without a pool, each merge only runs when it is its turn. With a pool, up to 'window' merges run ahead, results
+    that finish early are held back until every merge started before them was handed out.
+    :return: generator of (record, started, future of the result of _merge_job) in the order of merge_records
+    """
+    if pool is None:
+        for record in merge_records:
+            started = time.time()
+            yield record, started, _start_merge(record, started, None)
+        return
+    # submission index -> (record, started, future)
+    in_flight = dict()
+    next_index = 0
+    for (index, record) in enumerate(merge_records):
+        started = time.time()
+        in_flight[index] = (record, started, _start_merge(record, started, pool))
+        if len(in_flight) >= max(window, 1):
+            yield in_flight.pop(next_index)
+            next_index += 1
+    while len(in_flight) > 0:
+        yield in_flight.pop(next_index)
+        next_index += 1
+
+
+def _start_merge(record, started: float, pool: ProcessPoolExecutor):
+    """
+    Reads the inputs of the merge and journals its start. Merges right away without a pool.
+    :return: future of the result of _merge_job, holds the exception if reading or merging failed
+    """
+    try:
+        subrepo_path = record["contact_point"]
+        container_path = record["match"]
+        log.info(f"Creating a merged version of {os.path.basename(subrepo_path)}...")
+        with open(container_path, "r", encoding="utf-8") as f:
+            match = f.read()
+        records.journal(record["id"], records.STARTED, started=started, hash=content_hash(container_path))
+        with open(subrepo_path, "rb") as f:
+            raw_contact_point = f.read()
+        # universal newlines, like a file opened in text mode
+        contact_point = raw_contact_point.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+        entry = marker_index_entry(subrepo_path, raw_contact_point)
+        arguments = (match, contact_point, unmodified_file_content(subrepo_path),
+                     None if entry is None else entry["blocks"], subrepo_path, _is_values_file(container_path))
+        if pool is not None:
+            return pool.submit(_merge_job, *arguments)
+        future = Future()
+        future.set_result(_merge_job(*arguments))
+    except Exception as e:
+        future = Future()
+        future.set_exception(e)
+    return future
+
+
+def _merge_job(match: str, contact_point: str, unmodified_match_text: str, marker_blocks: list,
+               contact_point_path: str, values_file: bool):
+    """
+    @see _merge_contents, runs in the worker processes
+    :return: (merged, fallbacks, timing) timing is (seconds, size, lines) for the merge cost model, None if the
+    result came from the merge cache
+    """
+    started = time.perf_counter()
+    (merged, fallbacks, cached) = _merge_contents(match, contact_point, unmodified_match_text, marker_blocks,
+                                                  contact_point_path, values_file)
+    if cached:
+        return merged, fallbacks, None
+    size = len(match.encode("utf-8")) + len(contact_point.encode("utf-8"))
+    lines = match.count("\n") + contact_point.count("\n")
+    return merged, fallbacks, (time.perf_counter() - started, size, lines)
+
+
+def _init_merge_worker(config: dict, const: dict, deadline: float):
+    """
+    Initializer of the merge worker processes, they get the configuration of the patch.
+    """
+    global patch_deadline
+    _inject_config(config)
+    _inject_constants(const)
+    patch_deadline = deadline
+    mergecache.open_cache()
+
+
+def _is_values_file(container_path: str):
+    """
+    :return: True if the container file lies in the string root (values files)
+    """
+    string_root = os.path.normpath(src_string_folder())
+    return os.path.normpath(container_path).startswith(string_root + os.sep)
+
+
+def _is_copy_record(record):
+    """
+    :return: True if the match of the record ends with '.' (pure copy files are copied into a directory)
+    """
+    return re.search(r"\.$", record["match"]) is not None or re.search(r"/.$", record["match"]) is not None
+
+
+def _replace_file_content(path: str, content: str):
+    """
+    Atomically replaces the content of path, a crash leaves either the old or the new version.
+    """
+    tmp_path = path + ".fp_tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    shutil.copymode(path, tmp_path)
+    os.replace(tmp_path, path)
@@ -1,8 +1,13 @@
 import yaml
-from plumbum import local
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable
 
-from ..util import configuration, contact_points_folder_path, subrepo_path, path_diff, log, execute, find_separator
+from ..util import configuration, contact_points_folder_path, subrepo_path, log, find_separator, extraction_index_path
+from ..fileops import copy_files, make_dirs
+from ..scan import scan_files, save_marker_index, extraction_workers
+from ..discovery import candidate_files_of
+from ..fingerprint import load_index, save_index, index_entry, partition
 from .util import target_code_folder, target_string_folder, target_drawable_folder, target_layout_folder
 from .util import src_layout_folder, src_string_folder, src_drawable_folder, src_code_folder, manifest_path
 
@@ -12,125 +17,125 @@ import os
 def _prep_folders():
     """
     Clears/Creates target folders in the subrepo to later be filled with all files of contact "contact points"
-    expects to be run in bash-like shell
     :return:
     """
-    layout_path = target_layout_folder()
-    string_path = target_string_folder()
-    drawable_path = target_drawable_folder()
-    code_path = target_code_folder()
-    mkdir = local['mkdir']
-    rm = local['rm']
+    directories = [contact_points_folder_path(), target_layout_folder(), target_string_folder(),
+                   target_drawable_folder(), target_code_folder()]
     log.info("Clearing/creating layout, string, drawable, code directories at:")
     log.info(contact_points_folder_path())
-    execute(rm["-r", "-v", "-f", contact_points_folder_path()])
-    execute(mkdir[contact_points_folder_path()])
-    execute(mkdir[layout_path])
-    execute(mkdir[string_path])
-    execute(mkdir[drawable_path])
-    execute(mkdir[code_path])
+    shutil.rmtree(contact_points_folder_path(), ignore_errors=True)
     extra_files = configuration()['additional_extraction_file_contact_point_paths']
     if extra_files is not None:
         sep = find_separator(extra_files[0])
         for filepath in extra_files:
-            execute(mkdir[sep.join(filepath.split(sep)[0:-1])])
+            directories.append(sep.join(filepath.split(sep)[0:-1]))
+    make_dirs(directories)
 
 
-def _extract_files():
+def _extract_files(index: dict):
     """
     Walk through expected file hierarchy and find all files that contain the string marker named in configs
     Assumes Code to be in <feature_git_root>/..
     Additionally checks the AndroidManifest file.
+    The code, layout, drawable and string roots are discovered, scanned and copied concurrently with
+    'extraction_workers' threads. The result and the log order are the same as with a single worker.
+    :param index: fingerprint index (@see featurePatch.fingerprint), updated in place
     :return:
     """
-    _duplicate_files(subrepo_path(), src_code_folder(), None, target_code_folder())
-    _duplicate_files(subrepo_path(), src_layout_folder(), None, target_layout_folder())
-    _duplicate_files(subrepo_path(), src_drawable_folder(), None, target_drawable_folder())
-    _duplicate_files(subrepo_path(), src_string_folder(), None, target_string_folder())
-    _duplicate_manifest()
+    workers = extraction_workers()
+    roots = [(src_code_folder(), target_code_folder()), (src_layout_folder(), target_layout_folder()),
+             (src_drawable_folder(), target_drawable_folder()), (src_string_folder(), target_string_folder())]
+    listings = candidate_files_of([src for (src, _) in roots], os.path.basename(subrepo_path()),
+                                  configuration()["marker"], workers)
+    jobs = [(index.setdefault(src, dict()), listings[src], _target_mapper(src, trg)) for (src, trg) in roots]
+    log.debug(f"Checking {manifest_path()} for marker")
+    jobs.append((index.setdefault(manifest_path(), dict()), [manifest_path()],
+                 lambda src: manifest_path(subrepo_path=True)))
+    pairs = _sync_files(jobs, workers)
     extra_files = configuration()['additional_extraction_file_paths']
     if extra_files is not None:
         destination_paths = configuration()['additional_extraction_file_contact_point_paths']
         for (idx, path) in enumerate(extra_files):
             sep = find_separator(destination_paths[idx])
-            execute(local['cp'][path, sep.join(destination_paths[idx].split(sep)[0:-1])])
+            pairs.append((path, sep.join(destination_paths[idx].split(sep)[0:-1])))
+    copy_files(pairs, workers)
 
 
-def _duplicate_files(subrepo_path: str, top_level_source_dir: str, current_dir: str, top_level_target_dir: str):
+def _target_mapper(top_level_source_dir: str, top_level_target_dir: str):
     """
-        recursively walks through current dir and copies any file that contains the marker into the contact points folder
-        Checks each file for valid combination of 'start' and 'end' markers before copying and exits if any file is invalid
-    :param subrepo_path: path of the subrepo inside the container
     :param top_level_source_dir: where the files are expected to be listed (code, drawables, strings, layouts..)
-    :param current_dir: recursive directory helper, set to topLevelDir if None
     :param top_level_target_dir: target folder path
+    :return: function mapping a file of the source dir to its path in the contact points folder
     """
-    if current_dir is None:
-        current_dir = top_level_source_dir
-    for f_name in os.listdir(current_dir):
-        f_path = os.path.join(current_dir, f_name)
-        if f_name != os.path.basename(subrepo_path):
-            if os.path.isdir(f_path):
-                log.debug(f"Traversing into {f_name}")
-                _duplicate_files(subrepo_path, top_level_source_dir, f_path, top_level_target_dir)
-            elif os.path.isfile(f_path):
-                log.debug(f"Checking {f_name} for marker")
-                # if retcode == 1, no match was found
-                cmd = (local['cat'][f_path] | local['grep'][configuration()["marker"]])
-                (retcode, stdout, _) = execute(cmd, retcodes=(0, 1))
-                if retcode == 0:
-                    src = os.path.join(current_dir, f_name)
-                    if not _check_marker_matchings(src):
-                        log.critical(f"ERROR: File {src} had an unequal number of starts and ends! "
-                              f"Please review the file and run the extraction again.")
-                        exit(1)
-                    if top_level_source_dir != current_dir:
-                        # What needs to be created in the code folder if it doesn't exist yet
-                        intermediate = path_diff(f_path, top_level_source_dir)
-                        missing_dirs = path_diff(intermediate, f_name)
-                        target = os.path.join(top_level_target_dir, missing_dirs)
-                        log.debug(f"creating: {target}")
-                        if not os.path.isdir(target):
-                            execute(local['mkdir']['-p', target])
-                        trg = os.path.join(target, f_name)
-                    else:
-                        trg = os.path.join(top_level_target_dir, f_name)
-                    log.info(f"copying {src} into {trg}")
-                    local['cp'][src, trg]()
-            else:
-                log.error(f"{f_name} was not dir or file!")
+    def target_of(src: str):
+        target = os.path.join(top_level_target_dir, os.path.relpath(os.path.dirname(src), top_level_source_dir))
+        return os.path.normpath(os.path.join(target, os.path.basename(src)))
+    return target_of
 
 
-def _duplicate_manifest():
+def _sync_files(jobs: list[tuple[dict, list[str], Callable[[str], str]]], workers: int = None):
     """
-    Checks manifest file for marker and duplicates it if necessary.
+    Brings the contact points of the source roots up to date with the files found in them.
+    Changed files are rescanned and copied if they contain the marker, unchanged marked files are only copied
+    if their contact point is missing. Contact points whose sources lost their marker or vanished are deleted.
+    The changed files of all roots are scanned together, so the threads are balanced across roots.
+    Exits if any file has an unequal number of 'start' and 'end' markers.
+    :param jobs: (root_index, files, target_of) per source root:
+        root_index: fingerprint index of the source root, updated in place
+        files: all candidate files currently found in the source root (@see featurePatch.discovery)
+        target_of: maps a source file to its path in the contact points folder
+    :param workers: threads used for fingerprinting and scanning
+    :return: list of (source, contact point) pairs that need to be copied, in order of the jobs
     """
-    log.debug(f"Checking {manifest_path()} for marker")
-    # if retcode == 1, no match was found
-    cmd = (local['cat'][manifest_path()] | local['grep'][configuration()["marker"]])
-    (retcode, _, _) = execute(cmd, retcodes=(0, 1))
-    if retcode == 0:
-        log.info(f"Copying manifest into {contact_points_folder_path()}...")
-        cmd = local['cp'][manifest_path(), manifest_path(subrepo_path=True)]
-        execute(cmd)
+    if workers == 1:
+        partitions = [partition(root_index, files) for (root_index, files, _) in jobs]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            partitions = list(pool.map(lambda job: partition(job[0], job[1]), jobs))
+    changed_files = [path for (_, changed) in partitions for path in changed]
+    scans = dict((s["path"], s) for s in scan_files(changed_files, configuration()["marker"], workers))
+    invalid = [path for path in changed_files if scans[path]["has_marker"] and
+               scans[path]["starts"] != scans[path]["ends"]]
+    for src in invalid:
+        log.critical(f"ERROR: File {src} had an unequal number of starts and ends! "
+                     f"Please review the file and run the extraction again.")
+    if len(invalid) > 0:
+        exit(1)
+    pairs = []
+    for ((root_index, files, target_of), (unchanged, changed)) in zip(jobs, partitions):
+        to_copy = []
+        for path in changed:
+            s = scans[path]
+            if s["has_marker"] and not s["ordered"]:
+                log.warning(f"{s['path']} contains nested or missordered markers, only the outermost blocks will be "
+                            f"treated as immutable.")
+            previous = root_index.get(path)
+            if s["has_marker"]:
+                to_copy.append(path)
+            elif previous is not None and previous["has_marker"]:
+                _remove_contact_point(previous["target"], path)
+            root_index[path] = index_entry(s, target_of(path) if s["has_marker"] else None)
+        for src in unchanged:
+            if root_index[src]["has_marker"] and not os.path.isfile(root_index[src]["target"]):
+                to_copy.append(src)
+        found = set(files)
+        for src in [p for p in root_index.keys() if p not in found]:
+            if root_index[src]["has_marker"]:
+                _remove_contact_point(root_index[src]["target"], src)
+            del root_index[src]
+        log.info(f"{len(changed)} changed and {len(unchanged)} unchanged files, copying {len(to_copy)} contact points")
+        to_copy = set(to_copy)
+        pairs.extend((src, target_of(src)) for src in files if src in to_copy)
+    return pairs
 
 
-def _check_marker_matchings(file: str):
+def _remove_contact_point(target: str, src: str):
     """
-    :param file: The path of the file to examine
-    :return: true is there is an equal nr. of starts and ends (does not catch missorderings)
+    Deletes a contact point whose source no longer contains the marker.
     """
-    with open(file, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-    starts = 0
-    ends = 0
-    for l in lines:
-        if configuration()["marker"] in l:
-            if "start" in l:
-                starts += 1
-            elif "end" in l:
-                ends += 1
-    return starts == ends
+    if os.path.isfile(target):
+        log.info(f"{src} no longer contains the marker, removing {target}")
+        os.remove(target)
 
 
 def extract_feature(start_over=True):
@@ -138,8 +143,14 @@ def extract_feature(start_over=True):
         Extracts any files interfacing the feature into the 'contact_points' folder.
         PRE: config.yml correctly initialized
     :param start_over: Set False if you are continuing extraction after error or manual edit. Will restart the complete
-    process by default.
+    process by default. Otherwise the extraction is incremental: only files that changed since the last extraction
+    (according to the fingerprint index in the working dir) are rescanned and copied.
     """
     if start_over:
         _prep_folders()
-    _extract_files()
+        index = dict()
+    else:
+        index = load_index(extraction_index_path())
+    _extract_files(index)
+    save_index(index, extraction_index_path())
+    save_marker_index(index)
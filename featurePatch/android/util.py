@@ -58,7 +58,7 @@ def map_contact_points_path_to_container(filepath: str):
             return os.path.join(src_code_folder(), *intermediate_dirs, filename)
         if parent_dir == "layout":
             return os.path.join(src_layout_folder(), *intermediate_dirs, filename)
-        if parent_dir == "strings":
+        if parent_dir == "values":
             return os.path.join(src_string_folder(), *intermediate_dirs, filename)
         if parent_dir == "drawable":
             return os.path.join(src_drawable_folder(), *intermediate_dirs, filename)
@@ -0,0 +1,185 @@
+"""
+Key-aware merge of Android values files (strings.xml, dimens.xml, colors.xml, ...).
+A values file is a keyed collection: the children of <resources> are identified by their tag and 'name' attribute.
+Instead of line diffs and fuzzy matching, the three versions are scanned once and their elements are indexed by key:
+    - upstream is the base of the result, its formatting, comments and order are kept
+    - marker blocks of the modified predecessor are inserted after the element they follow in the modified
+      predecessor (the nearest one that is kept), upstream elements redefined in a block are dropped
+    - unmarked elements the feature added, changed or removed (compared to the unmodified predecessor) are added,
+      changed or removed as well, unless upstream changed them too
+Everything is a single pass over each text plus dict lookups.
+Files that are not plain values files (no <resources> root, markers within an element, duplicate keys, ...) are
+left to the line based merge (@see applyFeature._create_diff).
+"""
+import re
+
+from ..log import log
+
+# Comments, CDATA sections, declarations and tags of an xml file
+TOKEN = re.compile(r"<!--.*?-->|<!\[CDATA\[.*?]]>|<\?.*?\?>|<![^>]*>"
+                   r"|<(/?)([^\s/>]+)((?:[^>\"']|\"[^\"]*\"|'[^']*')*?)(/?)>", re.DOTALL)
+ATTRIBUTE = re.compile(r"""([\w:.-]+)\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+
+
+def _line_span(text: str, start: int, end: int):
+    """
+    :return: (start, end) widened to the start of the line and past the line break, if there is nothing but
+    whitespace in between
+    """
+    line_start = text.rfind("\n", 0, start) + 1
+    if text[line_start:start].strip() == "":
+        start = line_start
+    line_break = text.find("\n", end)
+    line_end = len(text) if line_break == -1 else line_break + 1
+    if text[end:line_end].strip() == "":
+        end = line_end
+    return start, end
+
+
+def _key(tag: str, attributes: str):
+    """
+    :return: (tag, name, product) or None if the element has no name
+    """
+    values = {m.group(1): m.group(2) if m.group(2) is not None else m.group(3) for m in ATTRIBUTE.finditer(attributes)}
+    if "name" not in values:
+        return None
+    return tag, values["name"], values.get("product")
+
+
+def parse_values(text: str, marker: str):
+    """
+    :return: None if text is not a plain values file, otherwise a dict with
+        elements: key -> text of the elements outside marker blocks, the text spans whole lines where possible
+        items: ('element', key, start, end) and ('block', keys, start, end) in document order
+        body_start: position after the opening <resources> tag (and its line break)
+    """
+    parsed = {"elements": dict(), "items": [], "body_start": None}
+    depth = 0
+    # (tag, key, start) of the open top level element
+    element = None
+    # (start, keys) of the open marker block
+    block = None
+    closed = False
+    for m in TOKEN.finditer(text):
+        if closed:
+            if m.group(2) is not None:
+                return None
+            continue
+        if m.group(2) is None:
+            # comment, CDATA, declaration or processing instruction
+            token = m.group(0)
+            if token.startswith("<!--") and marker in token:
+                if depth != 1:
+                    return None
+                if "start" in token:
+                    if block is not None:
+                        return None
+                    block = (m.start(), [])
+                elif "end" in token:
+                    if block is None:
+                        return None
+                    (start, end) = _line_span(text, block[0], m.end())
+                    parsed["items"].append(("block", block[1], start, end))
+                    block = None
+            continue
+        (closing, tag, attributes, self_closing) = m.groups()
+        if closing:
+            depth -= 1
+            if depth == 0:
+                if tag != "resources" or block is not None:
+                    return None
+                closed = True
+            elif depth == 1:
+                if element is None or element[0] != tag:
+                    return None
+                if not _add_element(parsed, text, element[1], element[2], m.end(), block):
+                    return None
+                element = None
+            continue
+        if depth == 0:
+            if tag != "resources" or self_closing:
+                return None
+            parsed["body_start"] = _line_span(text, m.end(), m.end())[1]
+        elif depth == 1:
+            if self_closing:
+                if not _add_element(parsed, text, _key(tag, attributes), m.start(), m.end(), block):
+                    return None
+                continue
+            element = (tag, _key(tag, attributes), m.start())
+        if not self_closing:
+            depth += 1
+    return parsed if closed else None
+
+
+def _add_element(parsed: dict, text: str, key: tuple, start: int, end: int, block: tuple):
+    """
+    :return: False if the key is not unique
+    """
+    if key is None:
+        # unnamed elements are not merged, they stay where upstream has them
+        return True
+    if block is not None:
+        block[1].append(key)
+        return True
+    if key in parsed["elements"]:
+        return False
+    (start, end) = _line_span(text, start, end)
+    parsed["elements"][key] = text[start:end]
+    parsed["items"].append(("element", key, start, end))
+    return True
+
+
+def merge_values(upstream: str, modified_predecessor: str, unmodified_predecessor: str, marker: str):
+    """
+    :return: the merged text or None if one of the texts is not a plain values file
+    """
+    ours = parse_values(upstream, marker)
+    theirs = parse_values(modified_predecessor, marker)
+    base = parse_values(unmodified_predecessor, marker)
+    if ours is None or theirs is None or base is None:
+        return None
+    block_keys = {key for (kind, keys, _, _) in theirs["items"] if kind == "block" for key in keys}
+
+    def merged_element(key):
+        """
+        :return: the text of the upstream element in the result, None if it is dropped
+        """
+        if key in block_keys:
+            return None
+        if key in base["elements"] and base["elements"][key] == ours["elements"][key]:
+            # upstream left it alone, the feature may have changed or removed it
+            return theirs["elements"].get(key)
+        return ours["elements"][key]
+
+    kept = {key for key in ours["elements"] if merged_element(key) is not None}
+    # anchor key -> texts to insert after the element, None inserts at the start
+    insertions = dict()
+    anchor = None
+    for (kind, key, start, end) in theirs["items"]:
+        if kind == "element" and key in kept:
+            anchor = key
+            continue
+        if kind == "block":
+            text = modified_predecessor[start:end]
+            if text in upstream:
+                log.info("Marker block is already part of upstream.")
+                continue
+        elif key in base["elements"] or key in ours["elements"]:
+            continue
+        else:
+            text = theirs["elements"][key]
+        insertions.setdefault(anchor, []).append(text if text.endswith("\n") else text + "\n")
+    merged = [upstream[:ours["body_start"]]]
+    merged.extend(insertions.get(None, []))
+    position = ours["body_start"]
+    for (kind, key, start, end) in ours["items"]:
+        if kind != "element":
+            continue
+        merged.append(upstream[position:start])
+        text = merged_element(key)
+        if text is not None:
+            merged.append(text)
+            merged.extend(insertions.get(key, []))
+        position = end
+    merged.append(upstream[position:])
+    return "".join(merged)
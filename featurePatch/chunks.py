@@ -0,0 +1,78 @@
+"""
+Anchor based chunking of large line diffs.
+Instead of handing two whole line id sequences (@see featurePatch.lines) to dmp.diff_main, the common prefix and
+suffix are trimmed first (vectorized with numpy if it is installed), the remainder is split at anchors, i.e., lines
+occurring once in both sequences (@see featurePatch.diff3.find_anchors), and only the regions between the anchors
+are diffed. Marker blocks are single entries of the sequences, a region boundary never cuts through one.
+A file that changed a little only produces small regions, the diff takes close to linear time and memory.
+"""
+from typing import Callable
+
+import diff_match_patch as dmp_module
+
+from .diff3 import find_anchors, longest_increasing
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _as_array(codes: str):
+    # line ids may be surrogate code points
+    return numpy.frombuffer(codes.encode("utf-32-le", "surrogatepass"), dtype=numpy.uint32)
+
+
+def common_prefix_length(codes1: str, codes2: str):
+    if numpy is None:
+        return dmp_module.diff_match_patch().diff_commonPrefix(codes1, codes2)
+    n = min(len(codes1), len(codes2))
+    mismatches = numpy.flatnonzero(_as_array(codes1[:n]) != _as_array(codes2[:n]))
+    return int(mismatches[0]) if len(mismatches) > 0 else n
+
+
+def common_suffix_length(codes1: str, codes2: str):
+    if numpy is None:
+        return dmp_module.diff_match_patch().diff_commonSuffix(codes1, codes2)
+    n = min(len(codes1), len(codes2))
+    tail1 = _as_array(codes1[len(codes1) - n:])[::-1]
+    tail2 = _as_array(codes2[len(codes2) - n:])[::-1]
+    mismatches = numpy.flatnonzero(tail1 != tail2)
+    return int(mismatches[0]) if len(mismatches) > 0 else n
+
+
+def chunked_diff(codes1: str, codes2: str, diff_region: Callable[[str, str], list]):
+    """
+    :param codes1: line id sequence of the first text
+    :param codes2: line id sequence of the second text
+    :param diff_region: diffs two (small) line id sequences, e.g., with dmp.diff_main
+    :return: diff turning codes1 into codes2, consecutive entries of the same type are merged
+    """
+    prefix = common_prefix_length(codes1, codes2)
+    suffix = common_suffix_length(codes1[prefix:], codes2[prefix:])
+    middle1 = codes1[prefix:len(codes1) - suffix]
+    middle2 = codes2[prefix:len(codes2) - suffix]
+    diffs = [(0, codes1[:prefix])]
+    (last_i, last_j) = (0, 0)
+    for (i, j) in longest_increasing(find_anchors(middle1, 0, len(middle1), middle2, 0, len(middle2))):
+        if i > last_i or j > last_j:
+            diffs.extend(_diff_region(middle1[last_i:i], middle2[last_j:j], diff_region))
+        diffs.append((0, middle1[i]))
+        (last_i, last_j) = (i + 1, j + 1)
+    diffs.extend(_diff_region(middle1[last_i:], middle2[last_j:], diff_region))
+    diffs.append((0, codes1[len(codes1) - suffix:]))
+    merged = []
+    for (op, codes) in diffs:
+        if len(codes) == 0:
+            continue
+        if merged and merged[-1][0] == op:
+            merged[-1][1].append(codes)
+        else:
+            merged.append((op, [codes]))
+    return [(op, "".join(parts)) for (op, parts) in merged]
+
+
+def _diff_region(codes1: str, codes2: str, diff_region: Callable[[str, str], list]):
+    if len(codes1) == 0 or len(codes2) == 0:
+        return [(-1, codes1), (1, codes2)]
+    return diff_region(codes1, codes2)
@@ -0,0 +1,112 @@
+"""
+Persisted cost model of the merges, used to start the longest merges first when patching with several worker
+processes (@see applyFeature.patch). One huge file started last would otherwise set the wall time of the patch.
+The model is a json dictionary stored in the working dir:
+    {<contact point path>: {"seconds", "size", "lines"}}
+"seconds" is the merge duration of the file, smoothed over the runs, "size" (bytes) and "lines" are the combined
+size of the contact point and the container file of the last run. Files without timings are estimated from their
+size and line count, the rates are fitted on the timed files.
+"""
+import json
+import os
+
+from .log import log
+
+# Weight of the latest timing of a file
+SMOOTHING = 0.5
+
+
+def load_model(model_path: str):
+    """
+    :return: the model or an empty dict if there is none (or it is unreadable)
+    """
+    if not os.path.isfile(model_path):
+        return dict()
+    try:
+        with open(model_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        log.warning(f"Could not read the merge cost model {model_path}, starting over.\n{e}")
+        return dict()
+
+
+def save_model(model: dict, model_path: str, keep: set[str] = None):
+    """
+    Atomically persists the model.
+    :param keep: if given, the keys of the current batch, the entries of all other files (e.g., files that no longer
+    exist) are dropped
+    """
+    if keep is not None:
+        for key in [key for key in model if key not in keep]:
+            del model[key]
+    tmp_path = model_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(model, f)
+    os.replace(tmp_path, model_path)
+
+
+def record_timing(model: dict, key: str, seconds: float, size: int, lines: int):
+    """
+    Adds the merge duration of a file to the model.
+    """
+    entry = model.get(key)
+    if entry is not None:
+        seconds = SMOOTHING * seconds + (1 - SMOOTHING) * entry["seconds"]
+    model[key] = {"seconds": seconds, "size": size, "lines": lines}
+
+
+def file_features(paths: list[str]):
+    """
+    :return: (size, lines) combined size in bytes and line count of the files, missing files count as empty
+    """
+    size = 0
+    lines = 0
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        with open(path, "rb") as f:
+            content = f.read()
+        size += len(content)
+        lines += content.count(b"\n")
+    return size, lines
+
+
+def _rates(model: dict):
+    """
+    Least squares fit of seconds = per_byte * size + per_line * lines over the timed files.
+    :return: (per_byte, per_line), falls back to the line count alone if the fit is degenerate
+    """
+    entries = list(model.values())
+    ss = sum(e["size"] * e["size"] for e in entries)
+    sl = sum(e["size"] * e["lines"] for e in entries)
+    ll = sum(e["lines"] * e["lines"] for e in entries)
+    st = sum(e["size"] * e["seconds"] for e in entries)
+    lt = sum(e["lines"] * e["seconds"] for e in entries)
+    determinant = ss * ll - sl * sl
+    if determinant > 1e-9 * ss * ll:
+        per_byte = (st * ll - lt * sl) / determinant
+        per_line = (lt * ss - st * sl) / determinant
+        if per_byte >= 0 and per_line >= 0:
+            return per_byte, per_line
+    total_lines = sum(e["lines"] for e in entries)
+    if total_lines > 0:
+        return 0.0, sum(e["seconds"] for e in entries) / total_lines
+    # nothing timed yet, only the order matters
+    return 0.0, 1.0
+
+
+def longest_first(model: dict, work: list[tuple[str, list[str]]]):
+    """
+    :param work: list of (key, paths of the files of the merge)
+    :return: indices into work, ordered by predicted duration, longest first
+    """
+    (per_byte, per_line) = _rates(model)
+    predicted = []
+    for (key, paths) in work:
+        entry = model.get(key)
+        if entry is not None:
+            predicted.append((entry["seconds"], entry["size"]))
+        else:
+            (size, lines) = file_features(paths)
+            predicted.append((per_byte * size + per_line * lines, size))
+    return sorted(range(len(work)), key=lambda i: predicted[i], reverse=True)
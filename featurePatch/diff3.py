@@ -0,0 +1,187 @@
+"""
+Three-way merge of line sequences (the 'diff3' merge engine).
+The sequences are the line id strings of featurePatch.lines, i.e., every element is a (grouped) line.
+
+The base is aligned with both derived versions by a patience diff: lines occurring exactly once in both sequences are
+matched up (longest increasing subsequence), the gaps in between are aligned recursively. Where no unique lines are
+left, the least frequent lines are used like in a histogram diff, difflib only aligns what remains.
+The base lines that are matched in both versions split the sequences into stable regions and changed regions, the
+latter are classified like diff3 does:
+    'unchanged': identical in all three
+    'a': only a changed the region
+    'b': only b changed the region
+    'same': a and b changed it the same way
+    'conflict': a and b changed it differently
+"""
+import bisect
+import difflib
+from collections import Counter
+
+# Elements occurring more often than this are never used as anchors, difflib aligns such regions
+MAX_ANCHOR_OCCURRENCES = 8
+
+UNCHANGED = "unchanged"
+A = "a"
+B = "b"
+SAME = "same"
+CONFLICT = "conflict"
+
+
+def _positions(seq, lo: int, hi: int):
+    """
+    :return: dict element -> list of its positions in seq[lo:hi]
+    """
+    positions = dict()
+    for i in range(lo, hi):
+        positions.setdefault(seq[i], []).append(i)
+    return positions
+
+
+def find_anchors(a, alo: int, ahi: int, b, blo: int, bhi: int):
+    """
+    Candidate anchors for the patience diff: the elements occurring exactly once in both ranges. If there are none
+    (e.g., repeated content), the elements that occur equally often in both with the lowest count, their occurrences
+    are paired up in order.
+    :return: list of (i, j) sorted by i
+    """
+    counts_a = Counter(a[alo:ahi])
+    counts_b = Counter(b[blo:bhi])
+    unique = [x for (x, n) in counts_a.items() if n == 1 and counts_b.get(x) == 1]
+    if len(unique) > 0:
+        # the last position of an element is its only position if it is unique
+        position_a = {x: i for (i, x) in enumerate(a[alo:ahi], alo)}
+        position_b = {x: j for (j, x) in enumerate(b[blo:bhi], blo)}
+        return sorted((position_a[x], position_b[x]) for x in unique)
+    counts = [n for (x, n) in counts_a.items() if n == counts_b.get(x)]
+    if len(counts) == 0 or min(counts) > MAX_ANCHOR_OCCURRENCES:
+        return []
+    lowest = min(counts)
+    positions_a = _positions(a, alo, ahi)
+    positions_b = _positions(b, blo, bhi)
+    anchors = []
+    for (x, p) in positions_a.items():
+        if len(p) == lowest and len(positions_b.get(x, ())) == lowest:
+            anchors.extend(zip(p, positions_b[x]))
+    anchors.sort()
+    return anchors
+
+
+def longest_increasing(anchors: list[tuple[int, int]]):
+    """
+    Patience sorting of anchors ordered by their position in a.
+    :return: the longest subsequence of anchors that is also increasing in b
+    """
+    tails = []
+    tail_positions = []
+    previous = [None] * len(anchors)
+    for (n, (_, j)) in enumerate(anchors):
+        lo = bisect.bisect_left(tails, j)
+        if lo > 0:
+            previous[n] = tail_positions[lo - 1]
+        if lo == len(tails):
+            tails.append(j)
+            tail_positions.append(n)
+        else:
+            tails[lo] = j
+            tail_positions[lo] = n
+    result = []
+    n = tail_positions[-1] if tail_positions else None
+    while n is not None:
+        result.append(anchors[n])
+        n = previous[n]
+    result.reverse()
+    return result
+
+
+def matching_pairs(a, b):
+    """
+    Patience diff of two sequences.
+    :return: sorted list of matched index pairs (i, j) with a[i] == b[j]
+    """
+    pairs = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        (alo, ahi, blo, bhi) = stack.pop()
+        # common prefix and suffix
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            pairs.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            pairs.append((ahi, bhi))
+        if alo == ahi or blo == bhi:
+            continue
+        anchors = find_anchors(a, alo, ahi, b, blo, bhi)
+        if len(anchors) == 0:
+            for (i, j, n) in difflib.SequenceMatcher(None, a[alo:ahi], b[blo:bhi], autojunk=False) \
+                    .get_matching_blocks():
+                pairs.extend((alo + i + k, blo + j + k) for k in range(n))
+            continue
+        (last_i, last_j) = (alo, blo)
+        for (i, j) in longest_increasing(anchors):
+            pairs.append((i, j))
+            stack.append((last_i, i, last_j, j))
+            (last_i, last_j) = (i + 1, j + 1)
+        stack.append((last_i, ahi, last_j, bhi))
+    pairs.sort()
+    return pairs
+
+
+def patience_diff(a: str, b: str):
+    """
+    Patience diff of two line id sequences in the format of dmp.diff_main, used when dmp runs out of time.
+    :return: list of (op, codes), op is -1 (delete), 0 (equal) or 1 (insert)
+    """
+    diffs = []
+    (last_i, last_j) = (0, 0)
+    for (i, j) in matching_pairs(a, b) + [(len(a), len(b))]:
+        for (op, codes) in ((-1, a[last_i:i]), (1, b[last_j:j]), (0, a[i:i + 1])):
+            if len(codes) == 0:
+                continue
+            if diffs and diffs[-1][0] == op:
+                diffs[-1][1].append(codes)
+            else:
+                diffs.append((op, [codes]))
+        (last_i, last_j) = (i + 1, j + 1)
+    return [(op, "".join(parts)) for (op, parts) in diffs]
+
+
+def merge_regions(base, a, b):
+    """
+    Aligns a and b with base and splits all three into regions.
+    :return: list of (kind, (base_lo, base_hi), (a_lo, a_hi), (b_lo, b_hi)), kind is one of the region kinds above
+    """
+    a_of = dict(matching_pairs(base, a))
+    b_of = dict(matching_pairs(base, b))
+    regions = []
+    (base_lo, a_lo, b_lo) = (0, 0, 0)
+    # base lines matched in both versions, their positions increase in a and b
+    stable = [(i, a_of[i], b_of[i]) for i in range(len(base)) if i in a_of and i in b_of]
+    stable.append((len(base), len(a), len(b)))
+    for (i, j, k) in stable:
+        if i > base_lo or j > a_lo or k > b_lo:
+            regions.append((_classify(base, a, b, (base_lo, i), (a_lo, j), (b_lo, k)), (base_lo, i), (a_lo, j),
+                            (b_lo, k)))
+        if i < len(base):
+            if regions and regions[-1][0] == UNCHANGED:
+                (_, (s_lo, _), (sa_lo, _), (sb_lo, _)) = regions[-1]
+                regions[-1] = (UNCHANGED, (s_lo, i + 1), (sa_lo, j + 1), (sb_lo, k + 1))
+            else:
+                regions.append((UNCHANGED, (i, i + 1), (j, j + 1), (k, k + 1)))
+        (base_lo, a_lo, b_lo) = (i + 1, j + 1, k + 1)
+    return regions
+
+
+def _classify(base, a, b, base_range, a_range, b_range):
+    base_chunk = base[base_range[0]:base_range[1]]
+    a_chunk = a[a_range[0]:a_range[1]]
+    b_chunk = b[b_range[0]:b_range[1]]
+    if a_chunk == b_chunk:
+        return UNCHANGED if a_chunk == base_chunk else SAME
+    if a_chunk == base_chunk:
+        return B
+    if b_chunk == base_chunk:
+        return A
+    return CONFLICT
@@ -0,0 +1,202 @@
+"""
+Candidate file discovery for the extraction and the matching.
+Two modes can be selected with the 'file_discovery' constant (const.yml):
+    filesystem: walk the directories, every file found is a candidate.
+    git: ask git once per root. Only tracked files are considered, build outputs, caches and untracked files are
+         never touched. When looking for the marker, 'git grep' already narrows the candidates down to marked files.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from plumbum import local
+
+from .log import log
+from .scan import scan_files
+from .util import constants, execute
+
+git = local['git']
+
+FILESYSTEM = "filesystem"
+GIT = "git"
+
+
+def discovery_mode():
+    """
+    :return: The configured discovery mode, 'filesystem' or 'git'
+    """
+    mode = constants()["file_discovery"]
+    if mode not in (FILESYSTEM, GIT):
+        log.critical(f"Unknown file_discovery mode '{mode}', expected '{FILESYSTEM}' or '{GIT}'.")
+        exit(1)
+    return mode
+
+
+def walk_files(top_level_dir: str, excluded: str = None):
+    """
+    recursively walks through top_level_dir and lists all files, skipping anything named 'excluded'.
+    :param top_level_dir: where to start the walk
+    :param excluded: name of a file or directory to skip (e.g., the subrepository)
+    :return: sorted list of file paths
+    """
+    files = []
+    for dirpath, dirnames, filenames in os.walk(top_level_dir):
+        dirnames[:] = sorted(d for d in dirnames if d != excluded)
+        log.debug(f"Traversing into {dirpath}")
+        for f_name in sorted(filenames):
+            f_path = os.path.join(dirpath, f_name)
+            if f_name == excluded:
+                continue
+            if os.path.isfile(f_path):
+                files.append(f_path)
+            else:
+                log.error(f"{f_name} was not dir or file!")
+    return files
+
+
+def _list_directory(directory: str, excluded: str):
+    """
+    One unit of work of parallel_walk_files, mirrors a single step of os.walk (symlinked directories are not followed).
+    :return: (sorted files, sorted subdirectories to descend into, names that were neither file nor directory)
+    """
+    files = []
+    subdirs = []
+    others = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.name == excluded:
+                    continue
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                elif os.path.isfile(entry.path):
+                    files.append(entry.path)
+                else:
+                    others.append(entry.name)
+    except OSError as e:
+        log.debug(f"Could not list {directory}: {e}")
+    return sorted(files), sorted(subdirs), sorted(others)
+
+
+def parallel_walk_files(top_level_dirs: list[str], excluded: str = None, workers: int = None):
+    """
+    Same result as walk_files for every directory in top_level_dirs, but all directories of all roots are listed
+    by a shared thread pool. Every directory is its own task, so idle workers pick up subdirectories of
+    whichever root is largest.
+    :return: dict top level dir -> list of files, ordered exactly like walk_files
+    """
+    listings = dict()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_list_directory, d, excluded): d for d in set(top_level_dirs) if os.path.isdir(d)}
+        while pending:
+            (done, _) = wait(pending.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                directory = pending.pop(future)
+                listings[directory] = future.result()
+                for subdir in listings[directory][1]:
+                    pending[pool.submit(_list_directory, subdir, excluded)] = subdir
+
+    def collect(directory: str, files: list[str]):
+        (dir_files, subdirs, others) = listings[directory]
+        for name in others:
+            log.error(f"{name} was not dir or file!")
+        files.extend(dir_files)
+        for subdir in subdirs:
+            collect(subdir, files)
+        return files
+
+    return {d: collect(d, []) if d in listings else [] for d in top_level_dirs}
+
+
+def _git_paths(top_level_dir: str, cmd, excluded: str):
+    """
+    Runs a git command listing NUL separated paths relative to top_level_dir.
+    :return: sorted list of absolute file paths, without anything below a path component named 'excluded'
+    """
+    (rc, stdout, stderr) = execute(cmd, retcodes=(0, 1), do_log=False)
+    if rc != 0 and stderr.strip():
+        log.critical(f"Git discovery failed in {top_level_dir}:\n{stderr}")
+        exit(1)
+    paths = []
+    for relative in filter(None, stdout.split("\0")):
+        if excluded is not None and excluded in relative.split("/"):
+            continue
+        paths.append(os.path.join(top_level_dir, *relative.split("/")))
+    return sorted(paths)
+
+
+def git_tracked_files(top_level_dir: str, excluded: str = None):
+    """
+    :return: sorted list of all files tracked by git below top_level_dir
+    """
+    return _git_paths(top_level_dir, git["-C", top_level_dir, "ls-files", "-z", "--", "."], excluded)
+
+
+def git_marked_files(top_level_dir: str, marker: str, excluded: str = None):
+    """
+    :return: sorted list of all tracked files below top_level_dir whose working tree version contains the marker
+    """
+    cmd = git["-C", top_level_dir, "grep", "-l", "-z", "-F", "-e", marker, "--", "."]
+    return _git_paths(top_level_dir, cmd, excluded)
+
+
+def _warn_untracked(top_level_dir: str, excluded: str):
+    """
+    Files that are neither tracked nor ignored are invisible to the git discovery, let the user know.
+    """
+    cmd = git["-C", top_level_dir, "ls-files", "-z", "--others", "--exclude-standard", "--", "."]
+    untracked = _git_paths(top_level_dir, cmd, excluded)
+    if len(untracked) > 0:
+        log.warning(f"{len(untracked)} untracked files in {top_level_dir} are not considered, "
+                    f"add them to git if they contain the marker:\n" + "\n".join(untracked[:20]))
+
+
+def candidate_files(top_level_dir: str, excluded: str = None, marker: str = None):
+    """
+    Lists the files below top_level_dir that need to be considered.
+    :param top_level_dir: root of the search
+    :param excluded: name of a file or directory to skip
+    :param marker: if set and discovering through git, only files containing the marker are returned
+    :return: sorted list of file paths
+    """
+    if not os.path.isdir(top_level_dir):
+        return []
+    if discovery_mode() == FILESYSTEM:
+        return walk_files(top_level_dir, excluded)
+    _warn_untracked(top_level_dir, excluded)
+    if marker is None:
+        return git_tracked_files(top_level_dir, excluded)
+    return git_marked_files(top_level_dir, marker, excluded)
+
+
+def candidate_files_of(top_level_dirs: list[str], excluded: str = None, marker: str = None, workers: int = None):
+    """
+    candidate_files for several roots at once. The roots are discovered concurrently unless workers is 1.
+    :return: dict top level dir -> sorted list of candidate files (@see candidate_files)
+    """
+    if workers == 1:
+        return {d: candidate_files(d, excluded, marker) for d in top_level_dirs}
+    if discovery_mode() == FILESYSTEM:
+        return parallel_walk_files(top_level_dirs, excluded, workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda d: candidate_files(d, excluded, marker), top_level_dirs))
+    return dict(zip(top_level_dirs, results))
+
+
+def benchmark_discovery(top_level_dir: str, marker: str, excluded: str = None):
+    """
+    Times the filesystem walk (+ reading every file for the marker) against 'git grep' on the same root and logs
+    the results.
+    :return: dict mode -> (seconds, number of marked files)
+    """
+    results = dict()
+    start = time.perf_counter()
+    marked = [s["path"] for s in scan_files(walk_files(top_level_dir, excluded), marker) if s["has_marker"]]
+    results[FILESYSTEM] = (time.perf_counter() - start, len(marked))
+    start = time.perf_counter()
+    marked = git_marked_files(top_level_dir, marker, excluded)
+    results[GIT] = (time.perf_counter() - start, len(marked))
+    for (mode, (seconds, count)) in results.items():
+        log.info(f"{mode} discovery of {top_level_dir}: {seconds:.3f}s, {count} marked files")
+    return results
@@ -0,0 +1,150 @@
+"""
+In-process file duplication replacing 'cp' and 'mkdir -p' subprocesses.
+Copies are attempted, in order, as a reflink clone (copy-on-write filesystems such as btrfs or xfs),
+with os.copy_file_range, with os.sendfile and finally with a plain buffered copy, whatever the platform supports.
+"""
+import errno
+import os
+import shutil
+import stat
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from .log import log
+from .fingerprint import content_hash
+
+# ioctl request number to clone a file on Linux, see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+# Errors indicating that a copy strategy is not available for this pair of files
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF, errno.ENOTTY,
+                errno.EPERM}
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def _reflink(src_fd: int, dst_fd: int):
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return True
+    except OSError as e:
+        if e.errno in _UNSUPPORTED:
+            return False
+        raise
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, size: int):
+    if not hasattr(os, "copy_file_range"):
+        return False
+    copied = 0
+    try:
+        while copied < size:
+            n = os.copy_file_range(src_fd, dst_fd, size - copied)
+            if n == 0:
+                break
+            copied += n
+    except OSError as e:
+        if copied == 0 and e.errno in _UNSUPPORTED:
+            return False
+        raise
+    return True
+
+
+def _sendfile(src_fd: int, dst_fd: int, size: int):
+    if not hasattr(os, "sendfile"):
+        return False
+    offset = 0
+    try:
+        while offset < size:
+            n = os.sendfile(dst_fd, src_fd, offset, size - offset)
+            if n == 0:
+                break
+            offset += n
+    except OSError as e:
+        if offset == 0 and e.errno in _UNSUPPORTED:
+            return False
+        raise
+    return True
+
+
+def copy_destination(src: str, dst: str):
+    """
+    :return: the path of the copy of src, dst may be an existing directory to copy into
+    """
+    return os.path.join(dst, os.path.basename(src)) if os.path.isdir(dst) else dst
+
+
+def _same_content(src: str, dst: str):
+    """
+    :return: True if dst exists with the same size, content and permission bits as src
+    """
+    if not os.path.isfile(dst):
+        return False
+    (src_stat, dst_stat) = (os.stat(src), os.stat(dst))
+    if src_stat.st_size != dst_stat.st_size or stat.S_IMODE(src_stat.st_mode) != stat.S_IMODE(dst_stat.st_mode):
+        return False
+    return content_hash(src) == content_hash(dst)
+
+
+def copy_file(src: str, dst: str, skip_identical: bool = False):
+    """
+    Copies the content and permission bits of src to dst, like 'cp src dst'.
+    PRE: the parent directory of dst exists.
+    :param src: file to copy
+    :param dst: target file or an existing directory to copy into
+    :param skip_identical: leave dst untouched if it already has the content of src
+    :return: the name of the strategy that was used, 'identical' if the copy was skipped
+    """
+    dst = copy_destination(src, dst)
+    if skip_identical and _same_content(src, dst):
+        return "identical"
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        if size == 0:
+            method = "empty"
+        elif _reflink(fsrc.fileno(), fdst.fileno()):
+            method = "reflink"
+        elif _copy_file_range(fsrc.fileno(), fdst.fileno(), size):
+            method = "copy_file_range"
+        elif _sendfile(fsrc.fileno(), fdst.fileno(), size):
+            method = "sendfile"
+        else:
+            shutil.copyfileobj(fsrc, fdst)
+            method = "buffered"
+    shutil.copymode(src, dst)
+    return method
+
+
+def make_dirs(directories):
+    """
+    Creates all missing directories, each distinct directory is only checked once.
+    """
+    for d in sorted(set(directories)):
+        if not os.path.isdir(d):
+            log.debug(f"creating: {d}")
+            os.makedirs(d, exist_ok=True)
+
+
+def copy_files(pairs: list[tuple[str, str]], workers: int = 1):
+    """
+    Copies all (src, dst) pairs, creating missing parent directories in one batch beforehand.
+    :param pairs: dst may also be an existing directory to copy into
+    :param workers: Number of threads copying concurrently, None lets python decide. Logging stays in order of pairs.
+    :return: Counter of the strategies used
+    """
+    make_dirs(os.path.dirname(dst) for (_, dst) in pairs if not os.path.isdir(dst))
+    for (src, dst) in pairs:
+        log.info(f"copying {src} into {dst}")
+    if workers == 1 or len(pairs) < 2:
+        methods = Counter(copy_file(src, dst) for (src, dst) in pairs)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            methods = Counter(pool.map(lambda pair: copy_file(*pair), pairs))
+    if len(pairs) > 0:
+        log.debug(f"Copied {len(pairs)} files: {dict(methods)}")
+    return methods
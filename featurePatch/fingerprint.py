@@ -0,0 +1,86 @@
+"""
+Persisted file fingerprint index used to make repeated extractions incremental.
+The index is a json dictionary stored in the working dir:
+    {<source root>: {<file path>: {"mtime", "size", "hash", "has_marker", "target", "blocks", "ordered", "pure_copy"}}}
+A file whose mtime and size did not change is considered unchanged. If only the mtime changed, the content hash
+decides. Only changed files are rescanned for the marker.
+"""
+import hashlib
+import json
+import os
+
+from .log import log
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def load_index(index_path: str):
+    """
+    :param index_path: where the index was persisted
+    :return: the index or an empty dict if there is none (or it is unreadable)
+    """
+    if not os.path.isfile(index_path):
+        return dict()
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        log.warning(f"Could not read fingerprint index {index_path}, rescanning everything.\n{e}")
+        return dict()
+
+
+def save_index(index: dict, index_path: str):
+    """
+    Atomically persists the index.
+    """
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+
+def content_hash(path: str):
+    """
+    :return: sha1 hexdigest of the file content
+    """
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def index_entry(scan: dict, target: str = None):
+    """
+    Creates an index entry from a scan result of featurePatch.scan.scan_file.
+    :param target: where the file was copied to in the contact points folder, if it contains the marker.
+    """
+    return {"mtime": scan["mtime"], "size": scan["size"], "hash": scan["hash"],
+            "has_marker": scan["has_marker"], "target": target,
+            "blocks": scan["blocks"], "ordered": scan["ordered"], "pure_copy": scan["pure_copy"]}
+
+
+def partition(root_index: dict, paths: list[str]):
+    """
+    Splits paths into files that did not change since the index was written and files that need to be rescanned.
+    Refreshes the mtime of entries whose content hash still matches.
+    :param root_index: the index of a single source root
+    :param paths: all files currently found in the source root
+    :return: (unchanged, changed) lists of paths, preserving the order of paths
+    """
+    unchanged = []
+    changed = []
+    for path in paths:
+        entry = root_index.get(path)
+        if entry is None or "blocks" not in entry:
+            changed.append(path)
+            continue
+        stat = os.stat(path)
+        if entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            unchanged.append(path)
+        elif entry["size"] == stat.st_size and entry["hash"] == content_hash(path):
+            entry["mtime"] = stat.st_mtime_ns
+            unchanged.append(path)
+        else:
+            changed.append(path)
+    return unchanged, changed
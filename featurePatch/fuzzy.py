@@ -0,0 +1,183 @@
+"""
+Indexed fuzzy matching of diff lines, used by applyFeature._transform_diffs.
+Comparing every deletion with every insertion is quadratic, instead identical strings are looked up in a dictionary
+and only plausible pairs are scored:
+
+1. Candidate index: strings are broken into character occurrence tokens ('a' #1, 'a' #2, ...). The number of shared
+   tokens ov bounds the partial ratio of a pair from above by 2*ov/(m+ov), m being the length of the shorter string.
+   With prefix filtering (tokens ordered by rarity) a pair can only reach the minimal score if the prefix of the
+   shorter string shares a token with the longer one, both directions are looked up in inverted indices.
+   For a handful of pairs, the bound is checked directly.
+2. Batched scoring: the survivors are scored with rapidfuzz (all cores with process.cdist if numpy is installed).
+   Its partial ratio is never lower than the one of fuzzywuzzy, so it is a safe filter.
+3. Confirmation: the remaining pairs are checked in order with fuzzywuzzy's partial_ratio, the results are exactly
+   the same as scoring every pair with fuzz.partial_ratio(...) >= min_score.
+"""
+import math
+from collections import Counter, defaultdict
+
+from fuzzywuzzy import fuzz
+from rapidfuzz import fuzz as rapid_fuzz, process
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Up to this many pairs, the bound is checked pair by pair instead of building an index
+DIRECT_PAIRS = 256
+
+# fuzzywuzzy rounds its scores, rapidfuzz and the token bound are compared against this much lower cutoff
+SCORE_MARGIN = 1.0
+
+
+def _tokens(text: str):
+    """
+    :return: set of (character, occurrence) tokens, the overlap of two token sets is the size of the multiset
+    intersection of their characters
+    """
+    return {(c, i) for (c, n) in Counter(text).items() for i in range(n)}
+
+
+def _required_overlap(length: int, min_score: float):
+    """
+    :return: minimal token overlap of a string of this length with a (longer) string to reach min_score
+    """
+    t = (min_score - SCORE_MARGIN) / 100
+    if t <= 0:
+        return 0
+    if t >= 2:
+        return length + 1
+    return math.ceil(length * t / (2 - t) - 1e-9)
+
+
+def _prefix(tokens: set, required: int, rank: dict):
+    """
+    :return: the first len(tokens) - required + 1 tokens in order of rank (rarest first)
+    """
+    ordered = sorted(tokens, key=lambda token: (rank.get(token, 0), token))
+    return ordered[:len(tokens) - required + 1]
+
+
+def _plausible_pairs(queries: list[str], candidates: list[str], min_score: float):
+    """
+    :return: dict query index -> sorted list of candidate indices that may reach min_score
+    """
+    if len(queries) * len(candidates) <= DIRECT_PAIRS:
+        return _bounded_pairs(queries, candidates, min_score)
+    return _indexed_pairs(queries, candidates, min_score)
+
+
+def _bounded_pairs(queries: list[str], candidates: list[str], min_score: float):
+    """
+    Checks the token overlap bound of every pair directly, cheaper than an index for a handful of (long) strings.
+    """
+    candidate_counts = [Counter(c) for c in candidates]
+    pairs = dict()
+    for (i, query) in enumerate(queries):
+        counts = Counter(query)
+        found = [j for (j, candidate) in enumerate(candidates)
+                 if sum((counts & candidate_counts[j]).values())
+                 >= _required_overlap(min(len(query), len(candidate)), min_score)]
+        if len(found) > 0:
+            pairs[i] = found
+    return pairs
+
+
+def _indexed_pairs(queries: list[str], candidates: list[str], min_score: float):
+    candidate_tokens = [_tokens(c) for c in candidates]
+    frequency = Counter(token for tokens in candidate_tokens for token in tokens)
+    rank = {token: n for (token, n) in frequency.items()}
+    # longer candidates are found through their full token set, shorter ones through their prefix
+    full_index = defaultdict(list)
+    prefix_index = defaultdict(list)
+    unfiltered = []
+    for (j, tokens) in enumerate(candidate_tokens):
+        for token in tokens:
+            full_index[token].append(j)
+        required = _required_overlap(len(candidates[j]), min_score)
+        if required == 0:
+            unfiltered.append(j)
+        else:
+            for token in _prefix(tokens, required, rank):
+                prefix_index[token].append(j)
+    pairs = dict()
+    for (i, query) in enumerate(queries):
+        tokens = _tokens(query)
+        found = {j for j in unfiltered if len(candidates[j]) < len(query)}
+        required = _required_overlap(len(query), min_score)
+        if required == 0:
+            found.update(j for j in range(len(candidates)) if len(candidates[j]) >= len(query))
+        else:
+            for token in _prefix(tokens, required, rank):
+                found.update(j for j in full_index.get(token, ()) if len(candidates[j]) >= len(query))
+        for token in tokens:
+            found.update(j for j in prefix_index.get(token, ()) if len(candidates[j]) < len(query))
+        if len(found) > 0:
+            pairs[i] = sorted(found)
+    return pairs
+
+
+def _scored_pairs(queries: list[str], candidates: list[str], pairs: dict, min_score: float):
+    """
+    Drops all pairs whose rapidfuzz partial ratio is below the cutoff.
+    :return: dict query index -> sorted list of candidate indices
+    """
+    cutoff = max(min_score - SCORE_MARGIN, 0)
+    if len(pairs) == 0:
+        return pairs
+    if numpy is not None:
+        rows = sorted(pairs)
+        columns = sorted({j for js in pairs.values() for j in js})
+        column_of = {j: k for (k, j) in enumerate(columns)}
+        scores = process.cdist([queries[i] for i in rows], [candidates[j] for j in columns],
+                               scorer=rapid_fuzz.partial_ratio, score_cutoff=cutoff, workers=-1)
+        return {i: [j for j in pairs[i] if scores[r][column_of[j]] >= cutoff] for (r, i) in enumerate(rows)}
+    scored = dict()
+    for (i, js) in pairs.items():
+        matches = process.extract(queries[i], {j: candidates[j] for j in js}, scorer=rapid_fuzz.partial_ratio,
+                                  score_cutoff=cutoff, limit=None)
+        scored[i] = sorted(j for (_, _, j) in matches)
+    return scored
+
+
+def first_fuzzy_matches(queries: list[str], candidates: list[str], min_score: float, query_first: bool = False,
+                        any_match: bool = False):
+    """
+    For every query, finds the first candidate with fuzz.partial_ratio >= min_score.
+    :param queries: strings to look up
+    :param candidates: strings to search in, in order
+    :param min_score: minimal fuzzywuzzy partial ratio
+    :param query_first: fuzzywuzzy's partial_ratio is not symmetric for strings of equal length, pass True to score
+    partial_ratio(query, candidate) instead of partial_ratio(candidate, query)
+    :param any_match: pass True if any matching candidate will do, not necessarily the first one
+    :return: list with the index of the first matching candidate or None for every query
+    """
+    result = [None] * len(queries)
+    if len(queries) == 0 or len(candidates) == 0:
+        return result
+    # identical strings score 100, most lines are found like this
+    first_index = dict()
+    if min_score <= 100:
+        for (j, candidate) in enumerate(candidates):
+            first_index.setdefault(candidate, j)
+    open_queries = []
+    for (i, query) in enumerate(queries):
+        result[i] = first_index.get(query)
+        if result[i] is None or (not any_match and result[i] > 0):
+            open_queries.append(i)
+    if len(open_queries) == 0:
+        return result
+    plausible = _plausible_pairs([queries[i] for i in open_queries], candidates, min_score)
+    # only candidates before an identical one can change the result
+    plausible = {open_queries[k]: [j for j in js if result[open_queries[k]] is None or j < result[open_queries[k]]]
+                 for (k, js) in plausible.items()}
+    pairs = _scored_pairs(queries, candidates, {i: js for (i, js) in plausible.items() if len(js) > 0}, min_score)
+    for (i, js) in pairs.items():
+        for j in js:
+            score = fuzz.partial_ratio(queries[i], candidates[j]) if query_first \
+                else fuzz.partial_ratio(candidates[j], queries[i])
+            if score >= min_score:
+                result[i] = j
+                break
+    return result
@@ -10,15 +10,21 @@ subrepo expects a bash shell. We make sure to map all paths to POSIX paths in th
 """
 import os
 import re
+import subprocess
+import threading
+import time
 
 import yaml
 from plumbum import local
-from .util import configuration, constants, path_diff, execute, contact_points_folder_path, CONTACT_POINTS, update_last_unmodified_branch_name, subrepo_path
-from .android.util import map_contact_points_path_to_container
+from .util import configuration, constants, path_diff, execute, update_last_unmodified_branch_name, subrepo_path
+from .android.util import map_contact_points_path_to_container, src_code_folder, src_layout_folder, src_drawable_folder, src_string_folder, manifest_path
 from .log import log
 
 git = local['git']
 
+# Set in the container config while the sparse checkout is the one of feature-patch
+SPARSE_CHECKOUT_CONFIG_KEY = "featurePatch.sparseCheckout"
+
 ###
 #
 # Configuration Constants
@@ -27,8 +33,6 @@ git = local['git']
 
 FEATUFEATURE_ROOT_PATH = None
 FEATURE_ACCESS_TOKEN = None
-FEATURE_TMP_CHECKOUT_LOCATION = None
-FEATURE_TMP_DIRNAME = None
 SUBREPO_VERBOSITY = None
 CONTAINER_ROOT_PATH = None
 CONTAINER_MAIN_BRANCH_NAME = None
@@ -39,8 +43,6 @@ GIT_VERBOSITY = None
 def initialize_git_constants():
     global FEATURE_ROOT_PATH
     global FEATURE_ACCESS_TOKEN
-    global FEATURE_TMP_CHECKOUT_LOCATION
-    global FEATURE_TMP_DIRNAME
     global SUBREPO_VERBOSITY
     global CONTAINER_ROOT_PATH
     global GITHUB_USERNAME
@@ -48,8 +50,6 @@ def initialize_git_constants():
     global CONTAINER_MAIN_BRANCH_NAME
     FEATURE_ROOT_PATH = configuration()["feature_git_root"]
     FEATURE_ACCESS_TOKEN = configuration()["feature_github_access_token"]
-    FEATURE_TMP_CHECKOUT_LOCATION = configuration()["feature_git_temp_root"]
-    FEATURE_TMP_DIRNAME = constants()["subrepo_temporary_directoryname"]
     SUBREPO_VERBOSITY = configuration()["subrepo_verbosity"]
     CONTAINER_ROOT_PATH = configuration()["container_git_root"]
     CONTAINER_MAIN_BRANCH_NAME = configuration()["container_main_branch_name"]
@@ -178,41 +178,138 @@ def _migration_branch_name(postfix: str):
     return constants()["migration_branch_base_name"] + postfix
 
 
-def unmodified_file_path(filepath: str, windows=False):
-    """
-    Defines the filepath for the checked out 'unmodified' previous version of the file in the 'contact_points' folder.
-    Assumes Posix by default and will map filepath accordingly.
-    :param filepath: Expects path to current, modified file in the 'contact_points' folder.
-    :param windows: Set True if the windows compliance is needed
-    :return: The path the unmodified file should be checked out to
-    """
-    separator = "\\" if windows else "/"
-    parts = filepath.split(separator)
-    filename = parts[-1]
-    # only include any path parts till 'contact_points'
-    i = 0
-    while i < len(parts) and parts[i] != CONTACT_POINTS:
-        i = i + 1
-    if i == len(parts):
-        # path was already relative
-        relpath = os.path.join(separator.join(filepath.split(separator)[:-1]), constants()["unmodified_file_base_name"] + "_" + filename)
-    else:
-        relpath = os.path.join(separator.join(filepath.split(separator)[i+1:-1]), constants()["unmodified_file_base_name"] + "_" + filename)
-    abspath = _map_path(os.path.join(contact_points_folder_path(), relpath), not windows)
-    return abspath
+###
+#
+# Unmodified file contents:
+# all blobs of the unmodified branch are served by a single, long-lived 'git cat-file --batch' process
+#
+###
+
+class MissingUnmodifiedFileError(Exception):
+    """
+    Raised when the unmodified branch has no version of a contact point's container file.
+    """
+    pass
+
 
+cat_file_process: subprocess.Popen = None
+unmodified_blobs = dict()
 
-def _checkout_unmodified_file(filepath: str):
+
+def _unmodified_object_name(filepath: str):
     """
-    Checks out the previous, unmodified version of a file in the 'contact_points' folder.
-    :param filepath: Which file to attempt to check out.
+    :param filepath: path to a file in the 'contact_points' folder
+    :return: <unmodified branch>:<path of the corresponding container file>
     """
-    _navigate_to(CONTAINER_ROOT_PATH)
     relative_unmodified_path = path_diff(map_contact_points_path_to_container(filepath),
                                          configuration()["container_git_root"])
-    unmodified_file_content = execute(git["show", f"{constants()["unmodified_branch"]}:{_map_path(relative_unmodified_path, True)}"])
-    with open(unmodified_file_path(filepath, configuration()["windows"]), "w", encoding="utf-8") as f:
-        f.write(unmodified_file_content)
+    return f"{constants()['unmodified_branch']}:{_map_path(relative_unmodified_path, True)}"
+
+
+def _cat_file():
+    """
+    :return: The running 'git cat-file --batch' process of the container, started on first use.
+    """
+    global cat_file_process
+    if cat_file_process is None or cat_file_process.poll() is not None:
+        cmd = git["-C", _map_path(CONTAINER_ROOT_PATH, True), "cat-file", "--batch"]
+        log.debug(f"Starting {cmd}")
+        cat_file_process = cmd.popen(stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return cat_file_process
+
+
+def _read_blob(stdout):
+    """
+    Reads one response of 'git cat-file --batch': '<sha> <type> <size>\n<content>\n' or '<name> missing\n'.
+    :return: The content as bytes, None if the object does not exist.
+    """
+    header = stdout.readline().decode("utf-8").rstrip("\n")
+    parts = header.split(" ")
+    if len(parts) != 3 or not parts[2].isdigit():
+        return None
+    content = stdout.read(int(parts[2]))
+    stdout.read(1)
+    return content
+
+
+def stop_blob_fetcher():
+    global cat_file_process
+    if cat_file_process is not None:
+        cat_file_process.stdin.close()
+        cat_file_process.wait()
+        cat_file_process = None
+
+
+def prefetch_unmodified_files(filepaths: list[str]):
+    """
+    Loads the unmodified versions of all filepaths into memory with one round trip to git.
+    :param filepaths: paths to files in the 'contact_points' folder
+    """
+    pending = [(p, _unmodified_object_name(p)) for p in dict.fromkeys(filepaths) if p not in unmodified_blobs]
+    if len(pending) == 0:
+        return
+    start = time.perf_counter()
+    process = _cat_file()
+    requests = "".join(f"{name}\n" for (_, name) in pending).encode("utf-8")
+
+    def write_requests():
+        # A separate thread, git blocks on a full stdout pipe while we are still writing
+        process.stdin.write(requests)
+        process.stdin.flush()
+
+    writer = threading.Thread(target=write_requests)
+    writer.start()
+    for (path, name) in pending:
+        unmodified_blobs[path] = _read_blob(process.stdout)
+    writer.join()
+    log.debug(f"Fetched {len(pending)} unmodified files in {time.perf_counter() - start:.3f}s")
+
+
+def unmodified_file_content(filepath: str):
+    """
+    The previous, unmodified version of a file in the 'contact_points' folder, as found on the unmodified branch.
+    Served from memory if it was prefetched.
+    :param filepath: path to a file in the 'contact_points' folder
+    :return: the file content with universal newlines (like a file opened in text mode)
+    :raises MissingUnmodifiedFileError: if the file does not exist on the unmodified branch
+    """
+    if filepath not in unmodified_blobs:
+        prefetch_unmodified_files([filepath])
+    content = unmodified_blobs.pop(filepath)
+    if content is None:
+        raise MissingUnmodifiedFileError(f"{_unmodified_object_name(filepath)} does not exist.")
+    return content.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def unchanged_upstream_files():
+    """
+    Lists the container files that did not change upstream, i.e., whose working tree version is still identical to
+    the unmodified branch. Merging a contact point into such a file yields the contact point itself.
+    :return: set of normalized absolute paths
+    """
+    root = _map_path(CONTAINER_ROOT_PATH, True)
+    tracked = execute(git["-C", root, "ls-files", "-z"], do_log=False).split("\0")
+    changed = execute(git["-C", root, "diff", "--name-only", "--no-renames", "-z", constants()["unmodified_branch"],
+                          "--"], do_log=False).split("\0")
+    unchanged = set(tracked).difference(changed)
+    unchanged.discard("")
+    log.debug(f"{len(unchanged)} of {len(tracked) - 1} container files did not change upstream")
+    return {os.path.normpath(os.path.join(CONTAINER_ROOT_PATH, *relative.split("/"))) for relative in unchanged}
+
+
+def stage_files(paths: list[str]):
+    """
+    Stages all paths of the container with a single 'git add', the paths are passed on stdin. They are literal
+    pathspecs, wildcards in file names only match the file itself.
+    :param paths: absolute paths of container files
+    """
+    if len(paths) == 0:
+        return
+    root = _map_path(CONTAINER_ROOT_PATH, True)
+    pathspecs = "\0".join(os.path.relpath(path, CONTAINER_ROOT_PATH).replace(os.sep, "/") for path in paths)
+    execute(git["--literal-pathspecs", "-C", root, "add", "--pathspec-from-file=-", "--pathspec-file-nul"]
+            << pathspecs, do_log=False)
+    log.info(f"Staged {len(paths)} patched files.")
 
 
 def _subrepo_name():
@@ -297,36 +394,30 @@ def create_feature_migration_branch(suffix: str=None):
 
 def _create_remote_subrepo_branch(branchname: str):
     """
-    Checkout master branch of subrepo in temporary location.
-    Use generic Git to create, checkout and push new branch to remote.
-    Remove local copy of subrepo.
+    Creates the branch on the feature remote with a ref-level push of the commit the subrepo was last pushed to
+    (recorded in .gitrepo), straight from the container. No copy of the feature repository is needed.
     :param branchname: How to call the new branch
     """
-    _checkout_tmp_subrepo()
-    execute(git["checkout", "-b", branchname])
-    execute(git["push", GIT_VERBOSITY, "--repo", _authenticated_subrepo_url(), "--set-upstream", "origin", branchname])
-    _delete_temporary_feature_checkout()
+    commit = _subrepo_upstream_commit()
+    execute(git["-C", _map_path(CONTAINER_ROOT_PATH, True), "push", GIT_VERBOSITY, _authenticated_subrepo_url(),
+                f"{commit}:refs/heads/{branchname}"])
 
 
-def _delete_temporary_feature_checkout():
-    _navigate_to(FEATURE_TMP_CHECKOUT_LOCATION)
-    execute(local["rm"]["-r", FEATURE_TMP_DIRNAME])
-
-
-def _checkout_tmp_subrepo():
+def _subrepo_upstream_commit():
     """
-    Checkout master branch of subrepo in temporary location.
+    The upstream commit of the subrepo as recorded in .gitrepo. Fetches the commit from the feature remote if the
+    container does not have it (e.g., a fresh clone of the container).
+    :return: sha of the commit
     """
-    _navigate_to(FEATURE_TMP_CHECKOUT_LOCATION)
-    # Idempotence
-    if _isdir(FEATURE_TMP_DIRNAME):
-        execute(local["rm"]["-r", FEATURE_TMP_DIRNAME])
-    execute(local["mkdir"][FEATURE_TMP_DIRNAME])
-    _navigate_to(os.path.join('.',FEATURE_TMP_DIRNAME))
-    # Create url containing username and pw for cloning
-    execute(git["clone", GIT_VERBOSITY, _authenticated_subrepo_url()])
-    output = execute(local["ls"])
-    _navigate_to(output.strip())
+    root = _map_path(CONTAINER_ROOT_PATH, True)
+    gitrepo_file = _path_join(_subrepo_name(), ".gitrepo")
+    commit = execute(git["-C", root, "config", "--file", gitrepo_file, "subrepo.commit"], do_log=False).strip()
+    (retcode, _, _) = execute(git["-C", root, "rev-parse", "--quiet", "--verify", f"{commit}^{{commit}}"],
+                              retcodes=(0, 1), do_log=False)
+    if retcode != 0:
+        branch = execute(git["-C", root, "config", "--file", gitrepo_file, "subrepo.branch"], do_log=False).strip()
+        execute(git["-C", root, "fetch", GIT_VERBOSITY, _authenticated_subrepo_url(), f"refs/heads/{branch}"])
+    return commit
 
 
 def delete_container_and_feature_migration_branch(tag: str):
@@ -337,11 +428,8 @@ def delete_container_and_feature_migration_branch(tag: str):
     _navigate_to(CONTAINER_ROOT_PATH)
     execute(git["push", "origin", "--delete", _migration_branch_name(tag)], retcodes=(0,1))
     execute(git['branch', "-d", _migration_branch_name(tag)], retcodes=(0,1))
-    _navigate_to(FEATURE_TMP_CHECKOUT_LOCATION)
-    _checkout_tmp_subrepo()
-    execute(git["push", GIT_VERBOSITY, "origin", "--delete", _migration_branch_name(tag)], retcodes=(0,1))
-    execute(git['branch', GIT_VERBOSITY, "-d", _migration_branch_name(tag)], retcodes=(0, 1))
-    _delete_temporary_feature_checkout()
+    execute(git["push", GIT_VERBOSITY, _authenticated_subrepo_url(), f":refs/heads/{_migration_branch_name(tag)}"],
+            retcodes=(0, 1))
 
 
 def merge_migration_branch(suffix: str = None):
@@ -374,20 +462,71 @@ def merge_migration_branch(suffix: str = None):
 
 def upgrade_container_to(tag: str):
     """
-        Fetches all tags and creates a branch for that tag. Merges the current main into the 'unmodified_branch'.
-         Merges main up to this tag and finally checks out the newly created branch.
+        Fetches the tag (@see _fetch_tag) and creates a branch for that tag. Merges the current main into the
+        'unmodified_branch'. Merges main up to this tag and finally checks out the newly created branch.
     :param tag: Which tag to upgrade to.
     :param main_branch_name: Name of the main branch.
     """
     log.info(f"Updating container to tag: {tag}")
     # checkout main
     _navigate_to(CONTAINER_ROOT_PATH)
+    update_sparse_checkout()
     execute(git["checkout", CONTAINER_MAIN_BRANCH_NAME])
-    execute(git["fetch", "--all", "--tags"])
+    _fetch_tag(tag)
     # Create new branch for this version of the container onto which to apply the feature
     execute(git["checkout", f"tags/{tag}", "-b", f'{configuration()["migration_branch_subscript"]}{tag}'])
 
 
+def _fetch_tag(tag: str):
+    """
+    Fetches the tag according to 'container_fetch_mode':
+        all: all branches and tags of every remote
+        targeted: only the tag (and its history) from the first remote that has it (@see _remote_with_tag)
+        partial: like targeted but without blobs, they are fetched lazily when checked out (the remote becomes a
+            promisor remote, it must support partial clones)
+    Logs the time the fetch took and how much the object store grew.
+    :param tag: Which tag to fetch
+    """
+    mode = constants()["container_fetch_mode"]
+    start = time.perf_counter()
+    size_before = _object_store_kib()
+    if mode == "all":
+        execute(git["fetch", "--all", "--tags"])
+    elif mode in ("targeted", "partial"):
+        options = ["--no-tags", "--filter=blob:none"] if mode == "partial" else ["--no-tags"]
+        remote = _remote_with_tag(tag)
+        execute(git["fetch", GIT_VERBOSITY, *options, remote, f"+refs/tags/{tag}:refs/tags/{tag}"])
+    else:
+        log.critical(f"Unknown container_fetch_mode '{mode}', expected one of: all, targeted, partial")
+        exit(1)
+    log.info(f"Fetched tag {tag} ({mode}) in {time.perf_counter() - start:.1f}s, "
+             f"the object store grew by {_object_store_kib() - size_before} KiB.")
+
+
+def _remote_with_tag(tag: str):
+    """
+    Asks the remotes of the container, in order, for the tag without fetching anything.
+    :return: name of the first remote that has the tag
+    """
+    remotes = execute(git["remote"], do_log=False).split()
+    for remote in remotes:
+        (rc, _, stderr) = execute(git["ls-remote", "--exit-code", remote, f"refs/tags/{tag}"], retcodes=(0, 2, 128),
+                                  do_log=False)
+        if rc == 0:
+            return remote
+        log.debug(f"{remote} does not provide tag {tag}.\n{stderr}")
+    log.critical(f"None of the remotes {remotes} has the tag {tag}.")
+    exit(1)
+
+
+def _object_store_kib():
+    """
+    :return: size of the loose and packed objects of the container in KiB
+    """
+    stats = dict(line.split(": ") for line in execute(git["count-objects", "-v"], do_log=False).splitlines())
+    return int(stats["size"]) + int(stats["size-pack"])
+
+
 def update_unmodified_branch(tag):
     """"
     Prepare unmodified_branch for the next sync by checking out the untouched current tag.
@@ -398,6 +537,7 @@ def update_unmodified_branch(tag):
     assert '_' in constants()["unmodified_branch"]
     new_unmodified_branchname = '_'.join(constants()["unmodified_branch"].split("_")[0:-1]) + f"_{tag}"
     _navigate_to(CONTAINER_ROOT_PATH)
+    update_sparse_checkout()
     # If 'unmodified_branch' already exists, delete it
     execute(git["branch", "-D", new_unmodified_branchname], retcodes=(0, 1))
     # Create 'unmodified_branch' with the new tag
@@ -415,11 +555,15 @@ def checkout_feature_migration_branch(tag: str):
 
 def checkout_feature(subrepo_branch: str):
     """
-    Clones a different branch of the subrepo.
+    Switches the subrepo to a different branch. With 'feature_switch_mode' incremental, only the differences between
+    the current and the target branch are applied (@see _switch_feature_incrementally), otherwise (or if that is not
+    possible) the branch is cloned.
     :param subrepo_branch: which branch to switch to
     :return:
     """
     _navigate_to(CONTAINER_ROOT_PATH)
+    if constants()["feature_switch_mode"] == "incremental" and _switch_feature_incrementally(subrepo_branch):
+        return
     execute(local["rm"]["-r", _subrepo_name()], retcodes=(0, 1))
     execute(local["mkdir"]["-p", _subrepo_name()])
     _commit_container(f"Commit before cloning branch {subrepo_branch} of subrepository.", retcodes=(0,1))
@@ -429,6 +573,55 @@ def checkout_feature(subrepo_branch: str):
     update_subrepo_parent()
 
 
+def _switch_feature_incrementally(subrepo_branch: str):
+    """
+    Fetches the target branch into the container and applies the tree diff between the upstream commit recorded in
+    .gitrepo and the branch to the subrepo directory. .gitrepo is updated in place, the result is committed like a
+    clone would be. Switching to the branch the subrepo already is at changes nothing.
+    PRE: cwd is the container root
+    :param subrepo_branch: which branch to switch to
+    :return: False if the subrepo does not match its recorded upstream commit (e.g., it was never cloned or has
+    unpushed changes), the branch has to be cloned then
+    """
+    gitrepo_file = _path_join(_subrepo_name(), ".gitrepo")
+    if not os.path.isfile(_map_path(gitrepo_file)):
+        return False
+    (rc, current, _) = execute(git["config", "--file", gitrepo_file, "subrepo.commit"], retcodes=(0, 1), do_log=False)
+    if rc != 0:
+        return False
+    (rc, _, _) = execute(git["fetch", GIT_VERBOSITY, _authenticated_subrepo_url(), f"refs/heads/{subrepo_branch}"],
+                         retcodes=(0, 1, 128))
+    if rc != 0:
+        return False
+    current = current.strip()
+    target = execute(git["rev-parse", "FETCH_HEAD"], do_log=False).strip()
+    _commit_container(f"Commit before switching subrepository to branch {subrepo_branch}.", retcodes=(0, 1))
+    # the committed subrepo directory must be the recorded upstream commit (.gitrepo aside)
+    (differs, _, _) = execute(git["diff", "--quiet", "--no-renames", current, f"HEAD:{_subrepo_name()}", "--",
+                                  ".", ":(exclude).gitrepo"], retcodes=(0, 1, 128), do_log=False)
+    if differs != 0:
+        log.info(f"Subrepository does not match its upstream commit {current}, cloning {subrepo_branch} instead.")
+        return False
+    (differs, _, _) = execute(git["diff", "--quiet", "--no-renames", current, target], retcodes=(0, 1), do_log=False)
+    if differs == 1:
+        diff = git["diff", "--binary", "--full-index", "--no-renames", current, target]
+        execute(diff | git["apply", "--index", f"--directory={_subrepo_name()}"])
+    url = configuration()['feature_git_remote_ssh'] if configuration()['checkout_feature_with_ssh'] else configuration()['feature_git_remote_https']
+    changed = [(key, value) for (key, value) in (("remote", url), ("branch", subrepo_branch), ("commit", target))
+               if execute(git["config", "--file", gitrepo_file, f"subrepo.{key}"], retcodes=(0, 1),
+                          do_log=False)[1].strip() != value]
+    if differs == 0 and not changed:
+        log.info(f"Subrepository already is at branch {subrepo_branch} ({target}), nothing to switch.")
+        return True
+    for (key, value) in changed:
+        execute(git["config", "--file", gitrepo_file, f"subrepo.{key}", value], do_log=False)
+    _commit_container(f"Switched subrepository to branch {subrepo_branch} ({target}).")
+    # Like after a clone, the parent is the commit containing the switch (currently HEAD)
+    update_subrepo_parent()
+    log.info(f"Switched subrepository from {current} to branch {subrepo_branch} ({target}) incrementally.")
+    return True
+
+
 def update_subrepo_parent():
     """
     Updates the parent of the subrepo to the last commit, only call after executing subrepo clone
@@ -449,10 +642,56 @@ def update_subrepo_parent():
 
 def checkout_container(branch):
     _navigate_to(CONTAINER_ROOT_PATH)
+    update_sparse_checkout()
     # Checkout does not have the -v option
     execute(git["checkout", branch])
 
 
+def _sparse_checkout_patterns():
+    """
+    Non-cone sparse checkout patterns of everything feature-patch reads or writes in the container: the android
+    roots, the manifest, the subrepository and the additional extraction files.
+    :return: list of patterns anchored at the container root
+    """
+    directories = [src_code_folder(), src_layout_folder(), src_drawable_folder(), src_string_folder(),
+                   FEATURE_ROOT_PATH]
+    files = [manifest_path()] + (configuration()["additional_extraction_file_paths"] or [])
+    patterns = []
+    for (paths, suffix) in ((directories, "/"), (files, "")):
+        for path in paths:
+            relative = os.path.relpath(path, CONTAINER_ROOT_PATH).replace(os.sep, "/")
+            # escape the gitignore wildcards
+            patterns.append("/" + re.sub(r"([*?\[\\])", r"\\\1", relative) + suffix)
+    return list(dict.fromkeys(patterns))
+
+
+def update_sparse_checkout():
+    """
+    If 'sparse_checkout' is set, restricts the working tree of the container to the paths feature-patch works on
+    (@see _sparse_checkout_patterns), later checkouts only touch those. Otherwise, a sparse checkout is disabled again,
+    but only if feature-patch enabled it (recorded as featurePatch.sparseCheckout in the container config), a sparse
+    checkout of the user is left alone.
+    """
+    root = _map_path(CONTAINER_ROOT_PATH, True)
+    (_, sparse, _) = execute(git["-C", root, "config", "--bool", "core.sparseCheckout"], retcodes=(0, 1),
+                             do_log=False)
+    (_, own, _) = execute(git["-C", root, "config", "--bool", SPARSE_CHECKOUT_CONFIG_KEY], retcodes=(0, 1),
+                          do_log=False)
+    if not constants()["sparse_checkout"]:
+        if own.strip() == "true":
+            if sparse.strip() == "true":
+                execute(git["-C", root, "sparse-checkout", "disable"])
+            execute(git["-C", root, "config", "--unset", SPARSE_CHECKOUT_CONFIG_KEY])
+        return
+    patterns = _sparse_checkout_patterns()
+    if sparse.strip() == "true" and own.strip() == "true" and \
+            execute(git["-C", root, "sparse-checkout", "list"], do_log=False).splitlines() == patterns:
+        return
+    execute(git["-C", root, "sparse-checkout", "set", "--no-cone", "--stdin"] << "\n".join(patterns) + "\n")
+    execute(git["-C", root, "config", "--bool", SPARSE_CHECKOUT_CONFIG_KEY, "true"], do_log=False)
+    log.info("Sparse checkout of the container limited to:\n" + "\n".join(patterns))
+
+
 def initialize_subrepo():
     """
     Initializes a fresh subrepository at 'FEATURE_ROOT_PATH' if this has not yet happened.
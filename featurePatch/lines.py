@@ -0,0 +1,92 @@
+"""
+Shared line table for the line diffs of a merge.
+All distinct lines of the texts taking part in a merge are interned once into a single table, every text becomes a
+sequence of line ids. The sequences are stored as strings with one character per line (chr(id)), i.e., compact
+integer arrays that diff_match_patch can diff directly, just like after dmp.diff_linesToChars but shared by all
+texts. The diffs are converted back to text at the very end.
+Lines keep their line break (the last one may have none), the lines of a marker block form a single entry.
+"""
+import sys
+
+from .log import log
+
+# chr(id) must be a valid code point
+MAX_LINES = sys.maxunicode + 1
+
+
+def marker_lines(text: str, marker: str, blocks: list = None):
+    """
+    Splits text like text.split("\n") but keeps the lines between a 'start' and an 'end' marker line together.
+    :param blocks: marker spans recorded during extraction (@see featurePatch.scan), the text is parsed if None
+    :return: list of lines without their line break, the lines of a marker block are joined with "\n"
+    """
+    lines = text.split("\n")
+    if blocks is not None:
+        grouped = []
+        current = 0
+        for b in blocks:
+            grouped.extend(lines[current:b["start_line"]])
+            grouped.append("\n".join(lines[b["start_line"]:b["end_line"] + 1]))
+            current = b["end_line"] + 1
+        grouped.extend(lines[current:])
+        return grouped
+    grouped = []
+    grouping = None
+    for line in lines:
+        if grouping is not None:
+            grouping.append(line)
+            if marker in line and "end" in line:
+                grouped.append("\n".join(grouping))
+                grouping = None
+        elif marker in line and "start" in line:
+            grouping = [line]
+        else:
+            grouped.append(line)
+    if grouping is not None:
+        log.warning(f"Marker block without end:\n{grouping[0]}")
+        grouped.append("\n".join(grouping))
+    return grouped
+
+
+def intern_lines(line_lists: list[list[str]]):
+    """
+    :param line_lists: the texts to intern, as returned by marker_lines
+    :return: (table, codes) the table maps ids to lines (with line break), codes holds the id sequence of every text
+    """
+    table = []
+    ids = dict()
+    codes = []
+    for lines in line_lists:
+        # re-attach the line breaks, a trailing empty line is not a line (same as dmp.diff_linesToChars)
+        entries = [line + "\n" for line in lines[:-1]]
+        if lines[-1] != "":
+            entries.append(lines[-1])
+        chars = []
+        for (n, entry) in enumerate(entries):
+            if entry not in ids and len(table) >= MAX_LINES - 1:
+                # Out of ids, the rest of the text becomes one line (like dmp does)
+                log.warning(f"More than {MAX_LINES} distinct lines, diffing the remainder as a single line.")
+                chars.append(chr(_intern("".join(entries[n:]), table, ids)))
+                break
+            chars.append(chr(_intern(entry, table, ids)))
+        codes.append("".join(chars))
+    return table, codes
+
+
+def _intern(entry: str, table: list[str], ids: dict):
+    i = ids.get(entry)
+    if i is None:
+        if len(table) == MAX_LINES:
+            raise ValueError(f"Cannot intern more than {MAX_LINES} distinct lines")
+        i = len(table)
+        ids[entry] = i
+        table.append(entry)
+    return i
+
+
+def decode_diff(diffs: list, table: list[str]):
+    """
+    :param diffs: diff over line id sequences
+    :return: the same diff over text
+    """
+    return [(op, "".join([table[ord(c)] for c in codes])) for (op, codes) in diffs]
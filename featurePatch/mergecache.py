@@ -0,0 +1,119 @@
+"""
+Content addressed cache of merge results, stored in 'merge_cache' in the working dir.
+Entries are keyed by the sha256 of the merge inputs (texts) and of everything else that influences the result: the
+marker, min_fuzz_score, the merge engine and CACHE_VERSION. Repeated patches (e.g., after fixing a single file, or
+when patching the same feature onto several forks) only merge the files whose inputs changed.
+Two kinds of entries are stored:
+    merged: the merged text of (upstream, modified predecessor, unmodified predecessor)
+    values: the same for values files, which are merged by key (@see android.valuesMerge)
+    intermediate: the line diff unmodified predecessor -> upstream, shared by all contact points of a container file
+The cache is only used while patching (@see open_cache). When it is closed, the least recently used entries are
+evicted until it fits into 'merge_cache_max_mb'.
+"""
+import gzip
+import hashlib
+import json
+import os
+
+from .log import log
+from .util import configuration, constants, merge_cache_path
+
+# Bump whenever the merge algorithms change their results
+CACHE_VERSION = 1
+
+# Entry kinds
+MERGED = "merged"
+VALUES = "values"
+INTERMEDIATE = "intermediate"
+
+cache_dir: str = None
+
+
+def open_cache():
+    """
+    Enables the cache, call before patching.
+    """
+    global cache_dir
+    cache_dir = merge_cache_path()
+    os.makedirs(cache_dir, exist_ok=True)
+
+
+def close_cache():
+    """
+    Evicts the least recently used entries beyond the size limit and disables the cache.
+    """
+    global cache_dir
+    if cache_dir is None:
+        return
+    _evict(float(constants()["merge_cache_max_mb"]) * 1024 * 1024)
+    cache_dir = None
+
+
+def cache_key(kind: str, texts: list[str]):
+    """
+    :param kind: MERGED, VALUES or INTERMEDIATE
+    :param texts: the inputs of the merge or the diff, in order
+    :return: key of the entry or None if the cache is disabled
+    """
+    if cache_dir is None:
+        return None
+    h = hashlib.sha256()
+    settings = [kind, str(CACHE_VERSION), constants()["merge_engine"], str(constants()["min_fuzz_score"]),
+                str(constants()["chunked_diff_min_lines"]), configuration()["marker"]]
+    for part in settings + texts:
+        data = part.encode("utf-8", "surrogatepass")
+        # length prefix, the concatenation of the parts is not unique
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()
+
+
+def _entry_path(key: str):
+    return os.path.join(cache_dir, key + ".json.gz")
+
+
+def lookup(key: str):
+    """
+    :return: the cached entry or None, a hit counts as a use for the eviction
+    """
+    if key is None or cache_dir is None or not os.path.isfile(_entry_path(key)):
+        return None
+    try:
+        with gzip.open(_entry_path(key), "rt", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, EOFError, json.JSONDecodeError) as e:
+        log.warning(f"Ignoring unreadable merge cache entry {_entry_path(key)}.\n{e}")
+        return None
+    os.utime(_entry_path(key))
+    return entry
+
+
+def store(key: str, entry: dict):
+    """
+    Atomically writes the entry (json serializable).
+    """
+    if key is None or cache_dir is None:
+        return
+    tmp_path = f"{_entry_path(key)}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=1) as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, _entry_path(key))
+
+
+def _evict(max_bytes: float):
+    entries = []
+    for dir_entry in os.scandir(cache_dir):
+        if dir_entry.is_file():
+            stat = dir_entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+    total = sum(size for (_, size, _) in entries)
+    entries.sort()
+    evicted = 0
+    for (_, size, path) in entries:
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+        evicted += 1
+    if evicted > 0:
+        log.info(f"Evicted {evicted} merge cache entries.")
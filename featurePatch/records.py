@@ -0,0 +1,288 @@
+"""
+Transactional store for the runtime and error records, backed by SQLite in the working dir.
+The processed flag is indexed, resuming a patch starts at the first unprocessed row.
+
+While patching, state transitions (started, merged, copied, failed) are only appended to a json lines journal
+which is fsynced in batches of 'journal_fsync_batch' entries. Before a merged file is written, the journal is synced
+(@see sync_journal), so the start of the merge is on disk and a crash cannot lead to merging the file twice. The
+journal is replayed into the store when the patch stops, or when the next patch starts after a crash.
+
+The json files 'runtime_record.txt' and 'errors.txt' are still written for humans: once at the end of the matching
+and whenever the patch stops. If the runtime record was edited by hand afterwards, it is imported back into the
+store before patching.
+"""
+import json
+import os
+import sqlite3
+import time
+
+from .log import log
+from .fingerprint import content_hash
+from .util import runtime_record_path, error_record_path, record_store_path, patch_journal_path, constants
+
+connection: sqlite3.Connection = None
+
+# Journal states
+STARTED = "started"
+MERGED = "merged"
+COPIED = "copied"
+FAILED = "failed"
+
+journal_file = None
+unsynced_entries = 0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    contact_point TEXT NOT NULL,
+    match TEXT NOT NULL,
+    processed INTEGER NOT NULL DEFAULT 0,
+    started REAL,
+    duration REAL,
+    error TEXT,
+    fallback TEXT
+);
+CREATE INDEX IF NOT EXISTS records_unprocessed ON records (processed, id);
+CREATE TABLE IF NOT EXISTS errors (
+    id INTEGER PRIMARY KEY,
+    contact_point TEXT NOT NULL,
+    message TEXT,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _store():
+    """
+    Provides a handle to the connection, opens (and creates) the database on first use.
+    """
+    global connection
+    if connection is None:
+        connection = sqlite3.connect(record_store_path())
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        _migrate(connection)
+    return connection
+
+
+def _migrate(db: sqlite3.Connection):
+    """
+    Adds the columns introduced after a store was created.
+    """
+    columns = [row["name"] for row in db.execute("PRAGMA table_info(records)")]
+    if "fallback" not in columns:
+        db.execute("ALTER TABLE records ADD COLUMN fallback TEXT")
+        db.commit()
+
+
+def close_store():
+    global connection
+    if connection is not None:
+        connection.commit()
+        connection.close()
+        connection = None
+
+
+def reset_store():
+    """
+    Removes all runtime and error records, call before matching.
+    """
+    with _store() as db:
+        db.execute("DELETE FROM records")
+        db.execute("DELETE FROM errors")
+        db.execute("DELETE FROM meta")
+
+
+def add_record(contact_point: str, match: str, commit=False):
+    """
+    :param contact_point: path to file in contact points folder
+    :param match: path to file in container repository (ends with '.' for pure copy files)
+    :param commit: the matching commits once at the end, pass True to persist immediately
+    """
+    _store().execute("INSERT INTO records (contact_point, match) VALUES (?, ?)", (contact_point, match))
+    if commit:
+        _store().commit()
+
+
+def add_error(contact_point: str, message: str):
+    """
+    Errors are rare and potentially followed by an exit, they are committed immediately.
+    """
+    with _store() as db:
+        db.execute("INSERT INTO errors (contact_point, message, created) VALUES (?, ?, ?)",
+                   (contact_point, message, time.time()))
+
+
+def record_count():
+    return _store().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+
+def unprocessed_records():
+    """
+    :return: list of all unprocessed records in order
+    """
+    return _store().execute("SELECT * FROM records WHERE processed = 0 ORDER BY id").fetchall()
+
+
+def commit():
+    _store().commit()
+
+
+def export_json():
+    """
+    Writes the runtime and error records as human readable json arrays
+    (same format as the records were always written in). Records whose diffs exceeded their time budget also name
+    the fallback that was used, records with merge conflicts name the conflicting lines.
+    """
+    records = []
+    for r in _store().execute("SELECT * FROM records ORDER BY id"):
+        record = {"contact_point": r["contact_point"], "match": r["match"], "processed": bool(r["processed"])}
+        if r["fallback"] is not None:
+            record["fallback"] = r["fallback"]
+        records.append(record)
+    errors = [{"contact_point": r["contact_point"], "match": "", "processed": False, "message": r["message"]}
+              for r in _store().execute("SELECT * FROM errors ORDER BY id")]
+    with open(runtime_record_path(), "w", encoding="utf-8") as f:
+        f.write(json.dumps(records, indent=1))
+    with open(error_record_path(), "w", encoding="utf-8") as f:
+        f.write(json.dumps(errors, indent=1))
+    with _store() as db:
+        db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('exported_mtime', ?)",
+                   (str(os.stat(runtime_record_path()).st_mtime_ns),))
+
+
+def _json_edited():
+    """
+    :return: True if the runtime record changed since it was exported (e.g., manual edits after matching) or if the
+    store is empty.
+    """
+    if not os.path.isfile(runtime_record_path()):
+        return False
+    row = _store().execute("SELECT value FROM meta WHERE key = 'exported_mtime'").fetchone()
+    return row is None or row[0] != str(os.stat(runtime_record_path()).st_mtime_ns) or record_count() == 0
+
+
+def _import_json():
+    """
+    Replaces the records of the store with the content of the runtime record.
+    """
+    log.info(f"Importing {runtime_record_path()} into the record store...")
+    with open(runtime_record_path(), "r", encoding="utf-8") as f:
+        records = json.load(f)
+    with _store() as db:
+        db.execute("DELETE FROM records")
+        db.executemany("INSERT INTO records (contact_point, match, processed, fallback) VALUES (?, ?, ?, ?)",
+                       [(r["contact_point"], r["match"], int(bool(r["processed"])), r.get("fallback"))
+                        for r in records])
+        db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('exported_mtime', ?)",
+                   (str(os.stat(runtime_record_path()).st_mtime_ns),))
+
+
+def prepare_patch():
+    """
+    Call before patching. Imports a manually edited runtime record, otherwise replays the journal of an interrupted
+    patch into the store.
+    """
+    if _json_edited():
+        if os.path.isfile(patch_journal_path()):
+            log.warning(f"{runtime_record_path()} was edited, discarding the journal of the interrupted patch.")
+            os.remove(patch_journal_path())
+        _import_json()
+    else:
+        compact_journal()
+
+
+###
+#
+# Patch journal
+#
+###
+
+
+def journal(record_id: int, state: str, **info):
+    """
+    Appends a state transition of a record to the journal. Failures are synced to disk immediately.
+    :param record_id: id of the record in the store
+    :param state: one of STARTED, MERGED, COPIED, FAILED
+    :param info: additional json serializable fields, e.g., started, duration, error, the fallback of a diff that
+    exceeded its time budget or the hash of the container file before it was merged
+    """
+    global journal_file
+    global unsynced_entries
+    if journal_file is None:
+        journal_file = open(patch_journal_path(), "a", encoding="utf-8")
+    entry = {"id": record_id, "state": state}
+    entry.update(info)
+    journal_file.write(json.dumps(entry) + "\n")
+    unsynced_entries += 1
+    if state == FAILED or unsynced_entries >= int(constants()["journal_fsync_batch"]):
+        sync_journal()
+
+
+def sync_journal():
+    """
+    Flushes and fsyncs the pending journal entries, call before overwriting a container file.
+    """
+    global unsynced_entries
+    if journal_file is not None and unsynced_entries > 0:
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+    unsynced_entries = 0
+
+
+def _read_journal():
+    """
+    :return: list of journal entries, stops at a torn last line
+    """
+    entries = []
+    if not os.path.isfile(patch_journal_path()):
+        return entries
+    with open(patch_journal_path(), "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                log.warning(f"Ignoring incomplete journal entry:\n{line}")
+                break
+    return entries
+
+
+def compact_journal():
+    """
+    Replays the journal into the store in a single transaction, rewrites the json records once and removes the journal.
+    A merge that was started but not journaled as finished counts as done if the container file changed since
+    (merged files are replaced atomically), otherwise it will be redone.
+    """
+    global journal_file
+    sync_journal()
+    if journal_file is not None:
+        journal_file.close()
+        journal_file = None
+    last_state = dict()
+    for entry in _read_journal():
+        last_state[entry["id"]] = entry
+    if len(last_state) == 0:
+        if os.path.isfile(patch_journal_path()):
+            os.remove(patch_journal_path())
+        return
+    updates = []
+    for (record_id, entry) in last_state.items():
+        if entry["state"] in (MERGED, COPIED, FAILED):
+            updates.append((entry.get("started"), entry.get("duration"), entry.get("error"), entry.get("fallback"),
+                            record_id))
+        elif entry["state"] == STARTED and "hash" in entry:
+            row = _store().execute("SELECT match FROM records WHERE id = ?", (record_id,)).fetchone()
+            if row is not None and os.path.isfile(row["match"]) and content_hash(row["match"]) != entry["hash"]:
+                log.info(f"{row['match']} was written before the interruption, marking it as merged.")
+                updates.append((entry.get("started"), None, None, None, record_id))
+    with _store() as db:
+        db.executemany("UPDATE records SET processed = 1, started = ?, duration = ?, error = ?, fallback = ? "
+                       "WHERE id = ?", updates)
+    export_json()
+    os.remove(patch_journal_path())
@@ -0,0 +1,194 @@
+"""
+In-process marker scanning for the extraction.
+Files are read through a thread pool and searched for the marker on the byte level, larger files are memory mapped.
+The 'start' and 'end' markers are counted in the same pass, so every file is only read once.
+Mirrors the semantics of the former cat | grep pipeline and the line based marker check:
+a line counts as 'start' if it contains the marker and the word 'start', else as 'end' if it contains 'end'.
+"""
+import hashlib
+import mmap
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .log import log
+from .fingerprint import content_hash
+from .util import constants, marker_index_path
+
+# Files below this size are read in one go, mapping them costs more than it saves
+MMAP_THRESHOLD = 64 * 1024
+
+
+def extraction_workers():
+    """
+    :return: Number of worker threads as set in 'extraction_workers' (const.yml), None lets python decide.
+    """
+    workers = constants()["extraction_workers"]
+    return None if workers == "None" or workers is None else int(workers)
+
+
+def pure_copy_pattern(marker: str):
+    """
+    A pure-copy file contains a marker 'start' immediately followed by a marker 'end' line without content inbetween,
+    indicating that the entire file should be copied.
+    :return: the multiline regex detecting such a marker pair (Java-style or XML comments)
+    """
+    return rf"{marker}\s*start\s*$\n^\s*//{marker}\s*end|" \
+           rf"{marker}\s*start\s*-->\s*$\n^\s*<!--\s*{marker}\s*end"
+
+
+def _scan_buffer(buf, needle: bytes, result: dict):
+    """
+    Counts the marker lines of buf into result. Each line is only counted once, even if it contains
+    the marker multiple times.
+    Records the marker blocks the same way 'lines.marker_lines' groups them: a block opens on a marker
+    line containing 'start' and closes on the next marker line containing 'end'. Lines are 0-based indices into
+    text.split("\n"), byte spans exclude the trailing newline of the 'end' line.
+    An 'end' without an open block or a 'start' inside an open block clears the 'ordered' flag, the latter also
+    invalidates the enclosing block.
+    """
+    pattern = re.compile(pure_copy_pattern(needle.decode("utf-8")), re.MULTILINE)
+    line_nr = 0
+    counted_until = 0
+    open_block = None
+    pos = buf.find(needle)
+    while pos != -1:
+        line_start = buf.rfind(b"\n", 0, pos) + 1
+        line_end = buf.find(b"\n", pos)
+        if line_end == -1:
+            line_end = len(buf)
+        # mmap has no count, slicing copies every byte at most once
+        line_nr += buf[counted_until:line_start].count(b"\n")
+        counted_until = line_start
+        line = buf[line_start:line_end]
+        if b"start" in line:
+            result["starts"] += 1
+        elif b"end" in line:
+            result["ends"] += 1
+        if open_block is None:
+            if b"start" in line:
+                open_block = {"start_line": line_nr, "start_byte": line_start, "valid": True}
+            elif b"end" in line:
+                result["ordered"] = False
+        elif b"end" in line:
+            open_block["end_line"] = line_nr
+            open_block["end_byte"] = line_end
+            result["blocks"].append(open_block)
+            snippet = bytes(buf[open_block["start_byte"]:line_end])
+            if not snippet[snippet.find(b"\n"):snippet.rfind(b"\n")].strip():
+                # Nothing but whitespace between the markers
+                snippet = snippet.decode("utf-8", errors="replace")
+                result["pure_copy"] = result["pure_copy"] or pattern.search(snippet) is not None
+            open_block = None
+        elif b"start" in line:
+            result["ordered"] = False
+            open_block["valid"] = False
+        pos = buf.find(needle, line_end)
+    if open_block is not None:
+        result["ordered"] = False
+
+
+def scan_file(path: str, needle: bytes):
+    """
+    Scans a single file for the marker.
+    :param path: The file to scan.
+    :param needle: The utf-8 encoded marker.
+    :return: dict with the keys 'path', 'has_marker', 'starts', 'ends', the marker 'blocks', whether they are
+    'ordered', the 'pure_copy' flag and the fingerprint 'mtime', 'size', 'hash'
+    """
+    result = {"path": path, "has_marker": False, "starts": 0, "ends": 0, "blocks": [], "ordered": True,
+              "pure_copy": False}
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        result["mtime"] = stat.st_mtime_ns
+        result["size"] = stat.st_size
+        if stat.st_size == 0:
+            result["hash"] = hashlib.sha1(b"").hexdigest()
+            return result
+        if stat.st_size < MMAP_THRESHOLD:
+            buf = f.read()
+            result["has_marker"] = needle in buf
+            if result["has_marker"]:
+                _scan_buffer(buf, needle, result)
+            result["hash"] = hashlib.sha1(buf).hexdigest()
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                result["has_marker"] = buf.find(needle) != -1
+                if result["has_marker"]:
+                    _scan_buffer(buf, needle, result)
+                result["hash"] = hashlib.sha1(buf).hexdigest()
+    return result
+
+
+def scan_files(paths: list[str], marker: str, workers: int = None):
+    """
+    Scans all files for the marker using a thread pool. Logs the throughput.
+    :param paths: The files to scan.
+    :param marker: The marker to look for, usually configuration()["marker"]
+    :param workers: Number of threads, defaults to 'extraction_workers'.
+    :return: list of scan results (@see scan_file) in the order of paths.
+    """
+    if workers is None:
+        workers = extraction_workers()
+    needle = marker.encode("utf-8")
+    start = time.perf_counter()
+    if workers == 1 or len(paths) < 2:
+        results = [scan_file(p, needle) for p in paths]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda p: scan_file(p, needle), paths))
+    elapsed = time.perf_counter() - start
+    rate = len(paths) / elapsed if elapsed > 0 else float(len(paths))
+    log.info(f"Scanned {len(paths)} files for the marker in {elapsed:.2f}s ({rate:.0f} files/s)")
+    return results
+
+
+# Lazily loaded marker index, @see marker_index_entry
+marker_index: dict = None
+
+
+def save_marker_index(fingerprint_index: dict):
+    """
+    Persists the marker block spans of all extracted files keyed by their contact point path, so matching and
+    patching don't need to parse the contact points again.
+    :param fingerprint_index: @see featurePatch.fingerprint, entries of marked files carry the scan results.
+    """
+    global marker_index
+    marker_index = dict()
+    for root_index in fingerprint_index.values():
+        for entry in root_index.values():
+            if entry["has_marker"]:
+                marker_index[os.path.normpath(entry["target"])] = {
+                    "size": entry["size"], "hash": entry["hash"], "blocks": entry["blocks"],
+                    "ordered": entry["ordered"], "pure_copy": entry["pure_copy"]}
+    tmp_path = marker_index_path() + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(marker_index, f)
+    os.replace(tmp_path, marker_index_path())
+
+
+def marker_index_entry(contact_point_path: str, content: bytes = None):
+    """
+    Looks up the marker spans recorded during extraction.
+    :param contact_point_path: path to a file in the contact points folder
+    :param content: the content of the file if the caller already read it, the file is hashed otherwise
+    :return: dict with 'blocks', 'ordered' and 'pure_copy' or None if the file is unknown or its content changed since
+    the extraction, e.g., by manual fixes (the caller should parse the file itself).
+    """
+    global marker_index
+    if marker_index is None:
+        if os.path.isfile(marker_index_path()):
+            with open(marker_index_path(), "r", encoding="utf-8") as f:
+                marker_index = json.load(f)
+        else:
+            marker_index = dict()
+    entry = marker_index.get(os.path.normpath(contact_point_path))
+    if entry is None or not os.path.isfile(contact_point_path) or os.path.getsize(contact_point_path) != entry["size"]:
+        return None
+    digest = content_hash(contact_point_path) if content is None else hashlib.sha1(content).hexdigest()
+    if digest != entry["hash"]:
+        log.info(f"{contact_point_path} changed since the extraction, parsing its markers again.")
+        return None
+    return entry
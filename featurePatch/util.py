@@ -211,6 +211,30 @@ def error_record_path():
     return os.path.join(configuration()["working_dir"], "errors.txt")
 
 
+def record_store_path():
+    return os.path.join(configuration()["working_dir"], "records.sqlite")
+
+
+def patch_journal_path():
+    return os.path.join(configuration()["working_dir"], "patch_journal.jsonl")
+
+
+def extraction_index_path():
+    return os.path.join(configuration()["working_dir"], "extraction_index.json")
+
+
+def marker_index_path():
+    return os.path.join(configuration()["working_dir"], "marker_index.json")
+
+
+def merge_cache_path():
+    return os.path.join(configuration()["working_dir"], "merge_cache")
+
+
+def merge_cost_model_path():
+    return os.path.join(configuration()["working_dir"], "merge_cost_model.json")
+
+
 def path_diff(long_path: str, short_path: str, sep=os.sep, tail=True):
     """
     Returns the difference in both paths, and removes a trailing os path separator if necessary.
@@ -278,7 +302,7 @@ def update_last_unmodified_branch_name(new_branchname):
 #####
 def _inject_config(new_config):
     """
-    Dependency injection for tests
+    Dependency injection for tests and worker processes
     """
     global config
     config = new_config
@@ -286,7 +310,7 @@ def _inject_config(new_config):
 
 def _inject_constants(new_constants):
     """
-    Dependency injection for tests
+    Dependency injection for tests and worker processes
     """
     global const
     const = new_constants
@@ -1,7 +1,8 @@
 from featurePatch.android.extractFeature import extract_feature
 from featurePatch.android.applyFeature import match as af_match
 from featurePatch.android.applyFeature import patch as af_patch
-from featurePatch.util import clear_contact_points, add_to_config_template
+from featurePatch.util import clear_contact_points, add_to_config_template, configuration
+from featurePatch.discovery import benchmark_discovery
 from featurePatch.git import *
 import argparse
 import re
@@ -93,6 +94,17 @@ def relink(args):
     checkout_feature(args.branch)
 
 
+def benchmark(args):
+    """
+    Times the filesystem and the git file discovery on the configured android roots without extracting anything.
+    Helps choosing the 'file_discovery' constant for a container.
+    """
+    print("#####\n##  Benchmarking file discovery...\n#####\n")
+    for root in (configuration()['android_src_root'], configuration()['android_layout_root'],
+                 configuration()['android_drawable_root'], configuration()['android_string_root']):
+        benchmark_discovery(root, configuration()['marker'], os.path.basename(configuration()['feature_git_root']))
+
+
 #####
 #
 # Operations
@@ -105,12 +117,14 @@ def extract(args):
     Creates an extraction branch named after 'tag' and checks it out. Then walks through all the relevant files in the
     android project and extracts the contact points of the container into the subrepository.
     :param args.tag: The version tag that is finally to be migrated to (this will determine the name of the extraction branch)
+    :param args.incremental: Re-extract into the already checked out migration branch, only copying changed files.
     """
     print(f"#####\n##  Extracting contact points\n#####\n")
     initialize_git_constants()
-    create_feature_migration_branch(args.tag)
-    checkout_feature_migration_branch(args.tag)
-    extract_feature()
+    if not args.incremental:
+        create_feature_migration_branch(args.tag)
+        checkout_feature_migration_branch(args.tag)
+    extract_feature(start_over=not args.incremental)
     push_subrepo("Extracted contact points")
 
 
@@ -151,10 +165,11 @@ def patch(args):
     """
     Walk through the runtime log and attempt to patch all the container files with the contact point files.
     Log any errors. Finally remove the contact points from the subrepository folder to allow for manual cleanup.
+    :param args.jobs: Number of worker processes for the merges.
     """
     initialize_git_constants()
     print("#####\n##  Patching container contact points...\n#####\n")
-    af_patch()
+    af_patch(args.jobs)
     print("#####\n##  Clearing feature contact points...\n#####\n")
     clear_contact_points()
 
@@ -213,6 +228,9 @@ def main():
                                                        "the subrepository named after the provided tag. "
                                                        "Finally pushed the new branch to the remote subrepo.")
     extraction.add_argument('tag', help='Tag to which to migrate the container')
+    extraction.add_argument('-i', '--incremental', action='store_true',
+                            help="Re-extract into the current migration branch, only rescanning and copying files "
+                                 "that changed since the last extraction.")
     extraction.set_defaults(func=extract)
 
     migration = subparsers.add_parser('migrate', help="Update the container to the specified tag and checkout "
@@ -235,6 +253,8 @@ def main():
     patching = subparsers.add_parser('patch', help="Copies and patches files wherever possible, updating runtime and "
                                                    "error logs and finally removes the contact points from the "
                                                    "subrepository to allow for manual cleanup.")
+    patching.add_argument('-j', '--jobs', type=int, default=1,
+                          help="Number of worker processes for the merges. Default: 1")
     patching.set_defaults(func=patch)
 
     merging = subparsers.add_parser('merge', help="Merges any changes that occured to adapt to the update back into "
@@ -254,6 +274,12 @@ def main():
     relink_feature.add_argument('branch', help='Which branch to check out', default='master')
     relink_feature.set_defaults(func=relink)
 
+    discovery_benchmark = subparsers.add_parser('benchmark_discovery', help="Times the filesystem walk against 'git "
+                                                                            "grep' on the configured android roots "
+                                                                            "and logs the number of marked files "
+                                                                            "found. Nothing is extracted.")
+    discovery_benchmark.set_defaults(func=benchmark)
+
     # CLI still TODO:
     # Deduce configs (some automation for the obvious things, e.g., deducable Android paths)
     # Set constant
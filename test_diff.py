@@ -1,9 +1,14 @@
 #import pytest
 import os
+import time
 import diff_match_patch as dmp_module
 from featurePatch.util import _inject_config, _inject_constants
+from featurePatch.android import applyFeature
 from featurePatch.android.applyFeature import (_line_diff, _group_marker_content, _ungroup_marker_content,
                                                _transform_diffs, _compute_line_diff, _create_diff, _create_intermediate_diffs)
+from featurePatch.fuzzy import first_fuzzy_matches
+from featurePatch.lines import intern_lines, decode_diff
+from featurePatch.android.valuesMerge import merge_values
 from tests.prototest import _print_all_diffs
 from fuzzywuzzy import fuzz
 
@@ -28,6 +33,18 @@ def _contents_equal(path1: str, path2: str):
 
 
 def test_diff():
+    _run_diff_testcases("dmp")
+
+
+def test_diff3():
+    _run_diff_testcases("diff3")
+
+
+def test_diff_chunked():
+    _run_diff_testcases("dmp", chunked_diff_min_lines=0)
+
+
+def _run_diff_testcases(merge_engine: str, chunked_diff_min_lines: int = 2000):
     exclude = ['02']
     #exclude = []
 
@@ -36,7 +53,11 @@ def test_diff():
     testcases.sort()
 
     # mock constants
-    (configs, constants) = mock_constants_and_config(add_const={"per_file_diff_deadline":"None", 'min_fuzz_score': '80'},
+    (configs, constants) = mock_constants_and_config(add_const={"per_file_diff_deadline":"None", 'min_fuzz_score': '80',
+                                                                'merge_engine': merge_engine,
+                                                                'chunked_diff_min_lines': chunked_diff_min_lines,
+                                                                'diff_budget_base': '0.5', 'diff_budget_per_kline': '0.1',
+                                                                'diff_budget_per_edit': '0.005'},
                               add_conf={"marker":"TI_GLUE: eNT9XAHgq0lZdbQs2nfH"})
     min_fuzz_score = float(constants['min_fuzz_score'])
     for t in testcases:
@@ -81,5 +102,104 @@ def test_diff():
             #assert(result)
 
 
+def test_fuzzy_matches():
+    test_path = "./tests/data/diff"
+    lines = []
+    for filename in sorted(os.listdir(test_path)):
+        if filename.startswith('01') or filename.startswith('04'):
+            with open(os.path.join(test_path, filename), 'r', encoding='utf-8') as f:
+                lines.extend(f.read().split('\n'))
+    lines = list(dict.fromkeys(lines))
+    # drop every 7th character to create fuzzy matches
+    queries = [''.join(c for (i, c) in enumerate(line) if i % 7 != 3) for line in lines[::25]] + lines[1::60]
+    candidates = lines[::9]
+    for min_fuzz_score in (0, 80, 95):
+        for query_first in (False, True):
+            expected = []
+            for q in queries:
+                scores = (fuzz.partial_ratio(q, c) if query_first else fuzz.partial_ratio(c, q) for c in candidates)
+                expected.append(next((j for (j, score) in enumerate(scores) if score >= min_fuzz_score), None))
+            assert(first_fuzzy_matches(queries, candidates, min_fuzz_score, query_first) == expected)
+
+
+def test_diff_budget_fallback():
+    test_path = "./tests/data/diff"
+    with open(os.path.join(test_path, next(f for f in os.listdir(test_path) if f.startswith('01') and 'upstream' in f)), 'r',
+              encoding='utf-8') as f:
+        upstream = f.read()
+    with open(os.path.join(test_path, next(f for f in os.listdir(test_path) if f.startswith('01') and '_modified' in f)), 'r',
+              encoding='utf-8') as f:
+        modified = f.read()
+    # a deadline cap of 0s leaves no time for dmp
+    mock_constants_and_config(add_const={"per_file_diff_deadline": "0", 'chunked_diff_min_lines': 2000,
+                                         'diff_budget_base': '0.5', 'diff_budget_per_kline': '0.1',
+                                         'diff_budget_per_edit': '0.005'},
+                              add_conf={"marker": "TI_GLUE: eNT9XAHgq0lZdbQs2nfH"})
+    (table, (codes1, codes2)) = intern_lines([upstream.split("\n"), modified.split("\n")])
+    fallbacks = []
+    diffs = decode_diff(_line_diff(codes1, codes2, fallbacks=fallbacks), table)
+    dmp = dmp_module.diff_match_patch()
+    assert(len(fallbacks) == 1 and fallbacks[0].startswith("patience diff, per_file_diff_deadline of 0s exhausted"))
+    assert(dmp.diff_text1(diffs) == upstream and dmp.diff_text2(diffs) == modified)
+    # the patch ran out of time
+    mock_constants_and_config(add_const={"per_file_diff_deadline": "None", 'chunked_diff_min_lines': 2000,
+                                         'diff_budget_base': '0.5', 'diff_budget_per_kline': '0.1',
+                                         'diff_budget_per_edit': '0.005'},
+                              add_conf={"marker": "TI_GLUE: eNT9XAHgq0lZdbQs2nfH"})
+    applyFeature.patch_deadline = time.time() - 1
+    fallbacks = []
+    try:
+        _line_diff(codes1, codes2, fallbacks=fallbacks)
+    finally:
+        applyFeature.patch_deadline = None
+    assert(len(fallbacks) == 1 and fallbacks[0].startswith("patience diff, time budget of the patch exhausted"))
+
+
+def test_diff3_conflict():
+    marker = "TI_GLUE: eNT9XAHgq0lZdbQs2nfH"
+    mock_constants_and_config(add_const={'merge_engine': 'diff3', 'min_fuzz_score': '80'}, add_conf={"marker": marker})
+    unmodified = "a();\nb();\ncall(x, y);\nd();\n"
+    # upstream changes the line above the one the feature changes
+    upstream = "a();\nb(1);\ncall(x, y);\nd();\n"
+    modified = f"a();\nb();\ncall(x, y, z); //{marker}\nd();\n"
+    fallbacks = []
+    text = _create_diff(upstream, modified, unmodified, None, fallbacks)
+    # both versions are kept between conflict markers
+    assert(text == f"a();\n<<<<<<< upstream\nb(1);\ncall(x, y);\n=======\nb();\ncall(x, y, z); //{marker}\n"
+                   f">>>>>>> feature\nd();\n")
+    assert(fallbacks == ["conflict at lines 2-8, both versions kept between conflict markers"])
+    # a conflict on the last line without a line break
+    assert(_create_diff("a();\nb(1);", "a();\nb(2);", "a();\nb();") ==
+           "a();\n<<<<<<< upstream\nb(1);\n=======\nb(2);\n>>>>>>> feature\n")
+    # changes on one side only are no conflicts
+    fallbacks = []
+    _create_diff("a();\nb();\ncall(x, y);\nd(1);\n", f"a();\n// {marker}\nb();\ncall(x, y);\nd();\n",
+                 unmodified, None, fallbacks)
+    assert(fallbacks == [])
+
+
+def test_values_merge():
+    test_path = "./tests/data/diff"
+    marker = "TI_GLUE: eNT9XAHgq0lZdbQs2nfH"
+    for t in ('01', '02'):
+        files = [f for f in os.listdir(test_path) if f.startswith(t)]
+        contents = dict()
+        for kind in ('upstream', '_modified', 'unmodified'):
+            with open(os.path.join(test_path, next(f for f in files if kind in f)), 'r', encoding='utf-8') as f:
+                contents[kind] = f.read()
+        text = merge_values(contents['upstream'], contents['_modified'], contents['unmodified'], marker)
+        assert(text is not None and text.count(f"{marker} start") == 1)
+        if t == '01':
+            # the feature changed nothing but the marker block
+            start = contents['_modified'].rindex("\n", 0, contents['_modified'].index(f"{marker} start")) + 1
+            end = contents['_modified'].index("\n", contents['_modified'].index(f"{marker} end")) + 1
+            assert(text.replace(contents['_modified'][start:end], "", 1) == contents['upstream'])
+        for p in (os.path.join(test_path, f) for f in files if 'expected' in f):
+            with open(p, 'r', encoding='utf-8') as f:
+                assert(fuzz.partial_ratio(text.strip(), f.read().strip()) >= 80)
+    # not a values file
+    assert(merge_values("class A {}", "class A {}", "class A {}", marker) is None)
+
+
 if __name__ == '__main__':
     test_diff()
\ No newline at end of file
@@ -0,0 +1,76 @@
+"""
+Compares the merge engines (dmp and diff3) on the diff testcases and on a generated large file.
+Run from the repository root:
+    python tests/benchmark_merge.py [repetitions]
+Prints the best time of every engine per input and whether the feature blocks survived the merge. dmp needs
+close to a minute for testcase 02 (that is why the diff tests skip it).
+"""
+import os
+import random
+import sys
+import time
+
+import yaml
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from featurePatch.util import _inject_config, _inject_constants
+from featurePatch.android.applyFeature import _create_diff
+
+MARKER = "TI_GLUE: eNT9XAHgq0lZdbQs2nfH"
+TEST_PATH = os.path.join(REPO_ROOT, "tests", "data", "diff")
+
+
+def _testcases():
+    """
+    :return: list of (name, upstream, modified predecessor, unmodified predecessor)
+    """
+    cases = []
+    for t in sorted({filename.split('-')[0] for filename in os.listdir(TEST_PATH)}):
+        files = [f for f in os.listdir(TEST_PATH) if f.startswith(t)]
+        contents = dict()
+        for kind in ('upstream', '_modified', 'unmodified'):
+            with open(os.path.join(TEST_PATH, next(f for f in files if kind in f)), 'r', encoding='utf-8') as f:
+                contents[kind] = f.read()
+        cases.append((t, contents['upstream'], contents['_modified'], contents['unmodified']))
+    return cases
+
+
+def _generated(lines: int = 3400, upstream_edits: int = 120, feature_blocks: int = 10, seed: int = 7):
+    """
+    A java-like file, upstream edits single lines, the feature inserts marker blocks.
+    :return: (name, upstream, modified predecessor, unmodified predecessor)
+    """
+    rng = random.Random(seed)
+    unmodified = [f"        int value{i} = compute({i}, {rng.randint(0, 999)});\n" for i in range(lines)]
+    upstream = list(unmodified)
+    for i in rng.sample(range(lines), upstream_edits):
+        upstream[i] = upstream[i].replace("compute", "computeFaster")
+    modified = list(unmodified)
+    for i in sorted(rng.sample(range(lines), feature_blocks), reverse=True):
+        modified[i:i] = [f"        // {MARKER} start\n", f"        feature.hook({i});\n", f"        // {MARKER} end\n"]
+    return f"generated {lines} lines", "".join(upstream), "".join(modified), "".join(unmodified)
+
+
+def main(repetitions: int = 1):
+    with open(os.path.join(REPO_ROOT, "conf", "const.yml"), 'r') as f:
+        const = yaml.safe_load(f)
+    _inject_config({"marker": MARKER})
+    print(f"{'input':<24}{'engine':<8}{'seconds':>10}  feature blocks kept")
+    for (name, upstream, modified, unmodified) in _testcases() + [_generated()]:
+        for engine in ("dmp", "diff3"):
+            const["merge_engine"] = engine
+            _inject_constants(const)
+            best = None
+            for _ in range(repetitions):
+                start = time.perf_counter()
+                merged = _create_diff(upstream, modified, unmodified)
+                seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            kept = merged.count(f"{MARKER} start") == modified.count(f"{MARKER} start")
+            print(f"{name:<24}{engine:<8}{best:>10.3f}  {kept}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1)
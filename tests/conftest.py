@@ -0,0 +1,269 @@
+"""
+Shared fixtures of the tests. Every fixture sets up its scratch files in the temporary directory of the test and
+injects the configuration and constants that go with them.
+The plain functions behind the fixtures are also called by the subprocesses some tests start.
+"""
+import os
+import subprocess
+import pytest
+import yaml
+from plumbum import local
+from featurePatch.util import _inject_config, _inject_constants
+from featurePatch import records, scan
+from featurePatch import git as fp_git
+
+TESTCASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "diff")
+
+MARKER = "TI_GLUE: eNT9XAHgq0lZdbQs2nfH"
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IDENTITY = {"GIT_AUTHOR_NAME": "test", "GIT_AUTHOR_EMAIL": "test@feature.patch",
+            "GIT_COMMITTER_NAME": "test", "GIT_COMMITTER_EMAIL": "test@feature.patch"}
+
+
+def write_file(path: str, content):
+    """
+    Writes content (str or bytes) to path, creating missing parent directories.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if isinstance(content, bytes):
+        with open(path, 'wb') as f:
+            f.write(content)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+
+def read_file(path: str, binary: bool = False):
+    if binary:
+        with open(path, 'rb') as f:
+            return f.read()
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def run_git(*args):
+    """
+    Runs git with the identity of the tests.
+    :return: stdout, stripped
+    """
+    return subprocess.run(["git", "-c", f"user.email={IDENTITY['GIT_AUTHOR_EMAIL']}", "-c",
+                           f"user.name={IDENTITY['GIT_AUTHOR_NAME']}"] + list(args),
+                          check=True, capture_output=True, text=True).stdout.strip()
+
+
+def diff_testcase(t: str):
+    """
+    :return: dict kind -> content of the upstream, _modified and unmodified files of the diff testcase
+    """
+    files = [f for f in os.listdir(TESTCASE_PATH) if f.startswith(t)]
+    return {kind: read_file(os.path.join(TESTCASE_PATH, next(f for f in files if kind in f)))
+            for kind in ('upstream', '_modified', 'unmodified')}
+
+
+def patch_config(root: str, add_const=dict()):
+    """
+    Injects the configuration and constants of the scratch container in root (@see scratch_patch).
+    :return: (container root, main folder of the app, feature root)
+    """
+    container = os.path.join(root, "container")
+    main = os.path.join(container, "app", "src", "main")
+    feature = os.path.join(main, "java", "ext")
+    with open(os.path.join(REPO_ROOT, "conf", "const.yml"), 'r') as f:
+        const = yaml.safe_load(f)
+    const.update({"unmodified_branch": "unmodified_v1", "journal_fsync_batch": 32})
+    const.update(add_const)
+    _inject_config({"working_dir": os.path.join(root, "work"), "marker": MARKER, "windows": False,
+                    "container_git_root": container, "container_main_branch_name": "main",
+                    "feature_git_root": feature, "feature_github_access_token": "",
+                    "github_username": "", "subrepo_verbosity": "-v", "git_verbosity": "-v",
+                    "android_src_root": os.path.join(main, "java"),
+                    "android_layout_root": os.path.join(main, "res", "layout"),
+                    "android_drawable_root": os.path.join(main, "res", "drawable"),
+                    "android_string_root": os.path.join(main, "res", "values"),
+                    "additional_extraction_file_paths": None, "additional_extraction_file_contact_point_paths": None})
+    _inject_constants(const)
+    fp_git.initialize_git_constants()
+    return container, main, feature
+
+
+def android_config(root: str):
+    """
+    Injects the configuration of an android project in root, the feature lives in the code root.
+    :return: (main folder of the app, code root)
+    """
+    main = os.path.join(root, "app", "src", "main")
+    code = os.path.join(main, "java")
+    _inject_config({"working_dir": root, "marker": MARKER, "feature_git_root": os.path.join(code, "ext"),
+                    "android_src_root": code, "android_layout_root": os.path.join(main, "res", "layout"),
+                    "android_drawable_root": os.path.join(main, "res", "drawable"),
+                    "android_string_root": os.path.join(main, "res", "values"),
+                    "additional_extraction_file_paths": None, "additional_extraction_file_contact_point_paths": None})
+    _inject_constants({"extraction_workers": 1, "file_discovery": "filesystem",
+                       "android_manifest_file": "AndroidManifest.xml"})
+    return main, code
+
+
+@pytest.fixture
+def marker():
+    return MARKER
+
+
+@pytest.fixture
+def write():
+    return write_file
+
+
+@pytest.fixture
+def read():
+    return read_file
+
+
+@pytest.fixture
+def git():
+    return run_git
+
+
+@pytest.fixture
+def git_identity(monkeypatch):
+    """
+    The identity of the tests for the git commands feature-patch runs (plumbum keeps its own copy of the environment).
+    """
+    for (key, value) in IDENTITY.items():
+        monkeypatch.setenv(key, value)
+        monkeypatch.setitem(local.env, key, value)
+
+
+@pytest.fixture
+def scratch_android(tmp_path):
+    """
+    An empty android project in tmp_path, ready to be extracted.
+    :return: the code root
+    """
+    (main, code) = android_config(str(tmp_path))
+    for directory in ("java/ext", "res/layout", "res/drawable", "res/values"):
+        os.makedirs(os.path.join(main, directory), exist_ok=True)
+    write_file(os.path.join(main, "AndroidManifest.xml"), "<manifest/>\n")
+    yield code
+    scan.marker_index = None
+
+
+@pytest.fixture
+def scratch_store(tmp_path):
+    """
+    A fresh record store in tmp_path with three records and an error, the first record is merged with a fallback.
+    """
+    _inject_config({"working_dir": str(tmp_path)})
+    _inject_constants({"journal_fsync_batch": 32})
+    records.close_store()
+    records.reset_store()
+    for name in ("A", "B", "C"):
+        records.add_record(os.path.join(str(tmp_path), "contactPoints", f"{name}.java"),
+                           os.path.join(str(tmp_path), f"{name}.java"))
+    records.add_error("D.java", "no match")
+    records.commit()
+    records.export_json()
+    first = records.unprocessed_records()[0]["id"]
+    records.journal(first, records.STARTED, started=1.0)
+    records.journal(first, records.MERGED, started=1.0, duration=0.5, fallback="patience diff after 0.1s")
+    records.compact_journal()
+    yield
+    records.close_store()
+
+
+@pytest.fixture
+def scratch_subrepo(tmp_path, monkeypatch, git_identity):
+    """
+    A feature remote (bare) in tmp_path with a master branch and a container whose subrepo 'ext' holds master. The
+    container never saw the commits of the feature repository, like a fresh clone. tmp_path is the working directory.
+    :return: (feature repository, container, sha of master)
+    """
+    root = str(tmp_path)
+    monkeypatch.chdir(root)
+    (remote, feature, container) = (os.path.join(root, n) for n in ("feature.git", "feature", "container"))
+    run_git("init", "-q", "--bare", remote)
+    run_git("init", "-q", "--bare", os.path.join(root, "container.git"))
+    run_git("init", "-q", "-b", "master", feature)
+    write_file(os.path.join(feature, "a"), b"a\n")
+    write_file(os.path.join(feature, "d", "gone"), b"gone\n")
+    write_file(os.path.join(feature, "bin"), bytes(range(256)) * 8)
+    run_git("-C", feature, "add", "-A")
+    run_git("-C", feature, "commit", "-qm", "master")
+    run_git("-C", feature, "push", "-q", remote, "master")
+    sha = run_git("-C", feature, "rev-parse", "HEAD")
+    run_git("init", "-q", "-b", "main", container)
+    run_git("-C", container, "remote", "add", "origin", os.path.join(root, "container.git"))
+    subprocess.run(f"git -C {feature} archive master | tar -x -C {container} --one-top-level=ext", shell=True,
+                   check=True)
+    write_file(os.path.join(container, "ext", ".gitrepo"),
+               f"[subrepo]\n\tremote = {remote}\n\tbranch = master\n\tcommit = {sha}\n\tparent = none\n"
+               f"\tmethod = merge\n")
+    run_git("-C", container, "add", "-A")
+    run_git("-C", container, "commit", "-qm", "container")
+    _inject_config({"feature_git_root": os.path.join(container, "ext"), "container_git_root": container,
+                    "container_main_branch_name": "main", "feature_github_access_token": "", "github_username": "",
+                    "subrepo_verbosity": "-v", "git_verbosity": "-v",
+                    "checkout_feature_with_ssh": True, "feature_git_remote_ssh": remote, "windows": False})
+    _inject_constants({"migration_branch_base_name": "migration", "feature_switch_mode": "incremental"})
+    fp_git.initialize_git_constants()
+    return feature, container, sha
+
+
+@pytest.fixture
+def patch_settings(tmp_path):
+    """
+    The configuration and constants of the scratch container in tmp_path, without creating it.
+    :return: (container root, main folder of the app, feature root)
+    """
+    return patch_config(str(tmp_path))
+
+
+@pytest.fixture
+def scratch_patch(tmp_path):
+    """
+    A container repository in tmp_path with a values file (testcase 01) and a java file (testcase 04), the
+    unmodified versions on the unmodified branch and the upstream versions checked out, and a layout file that did
+    not change upstream. The contact points hold the modified versions and are recorded in the record store, ready to
+    be patched.
+    :return: dict name -> (contact point path, container path)
+    """
+    root = str(tmp_path)
+    (container, main, feature) = patch_config(root)
+    files = {"values": ("01", os.path.join("res", "values", "dimens.xml"), os.path.join("values", "dimens.xml")),
+             "code": ("04", os.path.join("java", "AttachmentKeyboard.java"),
+                      os.path.join("code", "AttachmentKeyboard.java"))}
+    os.makedirs(os.path.join(root, "work"))
+    run_git("init", "-q", "-b", "main", container)
+    for (t, container_file, _) in files.values():
+        write_file(os.path.join(main, container_file), diff_testcase(t)['unmodified'])
+    layout = (os.path.join(feature, "contactPoints", "layout", "main.xml"),
+              os.path.join(main, "res", "layout", "main.xml"))
+    write_file(layout[1], "<LinearLayout>\n</LinearLayout>\n")
+    write_file(layout[0], f"<LinearLayout>\n<!-- {MARKER} start -->\n<View/>\n<!-- {MARKER} end -->\n"
+                          f"</LinearLayout>\n")
+    run_git("-C", container, "add", "-A")
+    run_git("-C", container, "commit", "-qm", "unmodified")
+    run_git("-C", container, "branch", "unmodified_v1")
+    paths = {"layout": layout}
+    for (name, (t, container_file, contact_point_file)) in files.items():
+        write_file(os.path.join(main, container_file), diff_testcase(t)['upstream'])
+        write_file(os.path.join(feature, "contactPoints", contact_point_file), diff_testcase(t)['_modified'])
+        paths[name] = (os.path.join(feature, "contactPoints", contact_point_file), os.path.join(main, container_file))
+    run_git("-C", container, "commit", "-qam", "upstream")
+    # fresh global state for every scratch repository
+    records.close_store()
+    scan.marker_index = None
+    fp_git.stop_blob_fetcher()
+    fp_git.unmodified_blobs.clear()
+    records.reset_store()
+    for (contact_point, match) in paths.values():
+        records.add_record(contact_point, match)
+    records.commit()
+    records.export_json()
+    yield paths
+    records.close_store()
+    fp_git.stop_blob_fetcher()
+
+
+@pytest.fixture
+def testcase():
+    return diff_testcase
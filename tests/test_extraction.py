@@ -0,0 +1,108 @@
+import os
+from featurePatch.util import _inject_config, _inject_constants, extraction_index_path, marker_index_path
+from featurePatch import scan
+from featurePatch.fingerprint import index_entry, load_index, partition
+from featurePatch.android import extractFeature
+from featurePatch.discovery import candidate_files, candidate_files_of
+
+
+def test_marker_index_detects_edits(tmp_path, marker, write):
+    _inject_config({"working_dir": str(tmp_path), "marker": marker})
+    _inject_constants({"extraction_workers": 1})
+    contact_point = os.path.join(str(tmp_path), "contactPoints", "code", "A.java")
+    write(contact_point, f"a\n// {marker} start\nb\n// {marker} end\nc\n")
+    result = scan.scan_file(contact_point, marker.encode("utf-8"))
+    scan.save_marker_index({"root": {"A.java": index_entry(result, contact_point)}})
+    scan.marker_index = None
+    entry = scan.marker_index_entry(contact_point)
+    assert(entry is not None and (entry["blocks"][0]["start_line"], entry["blocks"][0]["end_line"]) == (1, 3))
+    # a manual fix that moves the markers but keeps the size
+    write(contact_point, f"// {marker} start\na\nb\n// {marker} end\nc\n")
+    assert(scan.marker_index_entry(contact_point) is None)
+    with open(contact_point, "rb") as f:
+        assert(scan.marker_index_entry(contact_point, f.read()) is None)
+    scan.marker_index = None
+
+
+def test_incremental_extraction(scratch_android, marker, write):
+    code = scratch_android
+    marked = f"a\n// {marker} start\nb\n// {marker} end\n"
+    for (name, content) in (("A.java", marked), ("B.java", "a\n"), ("C.java", marked)):
+        write(os.path.join(code, name), content)
+    extractFeature.extract_feature(start_over=True)
+    contact_points = os.path.join(code, "ext", "contactPoints", "code")
+    assert(sorted(os.listdir(contact_points)) == ["A.java", "C.java"])
+    index = load_index(extraction_index_path())[code]
+    paths = [os.path.join(code, name) for name in ("A.java", "B.java", "C.java")]
+    assert(partition(index, paths) == (paths, []))
+    # only the mtime changed, the content hash decides
+    os.utime(paths[0], ns=(0, 0))
+    assert(partition(index, paths) == (paths, []) and index[paths[0]]["mtime"] == 0)
+    # B gains the marker, C loses it
+    write(paths[1], marked)
+    write(paths[2], "a\nb\n")
+    assert(partition(index, paths) == ([paths[0]], paths[1:]))
+    extractFeature.extract_feature(start_over=False)
+    assert(sorted(os.listdir(contact_points)) == ["A.java", "B.java"])
+    # the source of A vanishes
+    os.remove(paths[0])
+    extractFeature.extract_feature(start_over=False)
+    assert(sorted(os.listdir(contact_points)) == ["B.java"])
+
+
+def test_git_discovery_matches_walk(tmp_path, scratch_android, marker, write, read, git):
+    code = scratch_android
+    marked = f"a\n// {marker} start\nb\n// {marker} end\n"
+    for (name, content) in (("A.java", marked), ("pkg/B.java", "b\n"), ("pkg/sub dir/C é.java", marked),
+                            ("pkg/sub dir/D.kt", "d\n"), ("ext/contactPoints/code/A.java", marked),
+                            ("pkg/ext", marked)):
+        write(os.path.join(code, *name.split("/")), content)
+    git("init", "-q", str(tmp_path))
+    git("-C", str(tmp_path), "add", "-A")
+    git("-C", str(tmp_path), "commit", "-qm", "android")
+    roots = [code, os.path.join(os.path.dirname(code), "res", "values"), os.path.join(str(tmp_path), "missing")]
+    walked = {root: candidate_files(root, "ext") for root in roots}
+    assert(walked[code] == sorted(os.path.join(code, *name.split("/"))
+                                  for name in ("A.java", "pkg/B.java", "pkg/sub dir/C é.java", "pkg/sub dir/D.kt")))
+    assert(candidate_files_of(roots, "ext") == walked)
+    _inject_constants({"file_discovery": "git"})
+    assert({root: candidate_files(root, "ext") for root in roots} == walked)
+    assert(candidate_files_of(roots, "ext") == walked)
+    # git grep narrows the candidates down to the files with the marker
+    assert(candidate_files(code, "ext", marker) == [path for path in walked[code] if marker in read(path)])
+
+
+def _snapshot(contact_points: str, read):
+    """
+    :return: (relative path -> content of every contact point, extraction index, marker index)
+    """
+    files = dict()
+    for (dirpath, _, filenames) in os.walk(contact_points):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            files[os.path.relpath(path, contact_points)] = read(path, binary=True)
+    return files, read(extraction_index_path()), read(marker_index_path())
+
+
+def test_concurrent_extraction(scratch_android, marker, write, read):
+    code = scratch_android
+    main = os.path.dirname(code)
+    for i in range(60):
+        content = f"{i}\n// {marker} start\n{i}\n// {marker} end\n" if i % 3 else f"{i}\n"
+        write(os.path.join(code, f"p{i % 4}", f"q{i % 5}", f"F{i}.java"), content)
+        write(os.path.join(main, "res", "layout" if i % 2 else "drawable", f"f{i}.xml"),
+              f"<a>\n<!-- {marker} start -->\n<!-- {marker} end -->\n</a>\n" if i % 5 == 0 else "<a/>\n")
+    write(os.path.join(main, "res", "values", "strings.xml"), f"<resources>\n<!-- {marker} start -->\n"
+                                                              f"<!-- {marker} end -->\n</resources>\n")
+    write(os.path.join(main, "AndroidManifest.xml"), f"<manifest>\n<!-- {marker} start -->\n<!-- {marker} end -->\n"
+                                                     f"</manifest>\n")
+    contact_points = os.path.join(code, "ext", "contactPoints")
+    extractFeature.extract_feature(start_over=True)
+    sequential = _snapshot(contact_points, read)
+    assert(len(sequential[0]) == 40 + 12 + 1 + 1)
+    _inject_constants({"extraction_workers": 4, "file_discovery": "filesystem",
+                       "android_manifest_file": "AndroidManifest.xml"})
+    for path in (extraction_index_path(), marker_index_path()):
+        os.remove(path)
+    extractFeature.extract_feature(start_over=True)
+    assert(_snapshot(contact_points, read) == sequential)
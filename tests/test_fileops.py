@@ -0,0 +1,39 @@
+import os
+import stat
+from featurePatch.fileops import copy_file, copy_files
+
+
+def test_copy_file(tmp_path, write, read):
+    root = str(tmp_path)
+    (src, dst) = (os.path.join(root, "gradlew"), os.path.join(root, "copy"))
+    write(src, b"#!/bin/sh\n" * 1000)
+    os.chmod(src, 0o755)
+    assert(copy_file(src, dst, skip_identical=True) != "identical")
+    assert(read(dst, binary=True) == read(src, binary=True) and stat.S_IMODE(os.stat(dst).st_mode) == 0o755)
+    assert(copy_file(src, dst, skip_identical=True) == "identical")
+    # the same size and content with other permission bits is no identical copy
+    os.chmod(dst, 0o644)
+    assert(copy_file(src, dst, skip_identical=True) != "identical" and stat.S_IMODE(os.stat(dst).st_mode) == 0o755)
+    # the same size with other content neither
+    write(dst, b"#!/bin/zz\n" * 1000)
+    assert(copy_file(src, dst, skip_identical=True) != "identical" and read(dst, binary=True) == read(src, binary=True))
+    assert(copy_file(src, dst) != "identical")
+    # empty files and copies into a directory
+    empty = os.path.join(root, "empty")
+    write(empty, b"")
+    os.makedirs(os.path.join(root, "dir"))
+    assert(copy_file(empty, os.path.join(root, "dir")) == "empty")
+    assert(os.path.isfile(os.path.join(root, "dir", "empty")))
+
+
+def test_copy_files(tmp_path, write, read):
+    root = str(tmp_path)
+    pairs = []
+    for i in range(8):
+        src = os.path.join(root, f"{i}.txt")
+        write(src, str(i).encode() * (i + 1))
+        pairs.append((src, os.path.join(root, "a", "b" if i % 2 else "c", f"{i}.txt")))
+    methods = copy_files(pairs, workers=4)
+    assert(sum(methods.values()) == len(pairs))
+    for (src, dst) in pairs:
+        assert(read(dst, binary=True) == read(src, binary=True))
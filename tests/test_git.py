@@ -0,0 +1,200 @@
+import os
+import subprocess
+from featurePatch.util import _inject_config, _inject_constants, configuration, constants
+from featurePatch import git as fp_git
+
+
+def _remote_branches(root: str, git):
+    return git("-C", os.path.join(root, "feature.git"), "for-each-ref", "--format=%(refname:short) %(objectname)",
+               "refs/heads").split("\n")
+
+
+def test_migration_branch_push(tmp_path, scratch_subrepo, git):
+    root = str(tmp_path)
+    (feature, container, sha) = scratch_subrepo
+    # the upstream commit is fetched first, the container does not have it
+    fp_git._create_remote_subrepo_branch("migration_v1")
+    assert(_remote_branches(root, git) == [f"master {sha}", f"migration_v1 {sha}"])
+    assert(git("-C", container, "cat-file", "-t", sha) == "commit")
+    fp_git.delete_container_and_feature_migration_branch("v1")
+    assert(_remote_branches(root, git) == [f"master {sha}"])
+    # deleting a branch that does not exist is no error
+    fp_git.delete_container_and_feature_migration_branch("v1")
+
+
+def _subrepo_matches(container: str, commit: str):
+    return subprocess.run(["git", "-C", container, "diff", "--quiet", commit, "HEAD:ext", "--", ".",
+                           ":(exclude).gitrepo"]).returncode == 0
+
+
+def test_incremental_switch(tmp_path, monkeypatch, scratch_subrepo, git, write):
+    root = str(tmp_path)
+    (feature, container, sha) = scratch_subrepo
+    # a branch that changes a binary file and a file mode, adds and deletes a file
+    git("-C", feature, "checkout", "-qb", "feat")
+    write(os.path.join(feature, "bin"), bytes(reversed(range(256))) * 8)
+    os.chmod(os.path.join(feature, "a"), 0o755)
+    write(os.path.join(feature, "d", "new"), b"new\n")
+    git("-C", feature, "rm", "-q", os.path.join("d", "gone"))
+    git("-C", feature, "add", "-A")
+    git("-C", feature, "commit", "-qm", "feat")
+    git("-C", feature, "push", "-q", os.path.join(root, "feature.git"), "feat")
+    feat = git("-C", feature, "rev-parse", "HEAD")
+    gitrepo_file = os.path.join(container, "ext", ".gitrepo")
+    fp_git.checkout_feature("feat")
+    assert(_subrepo_matches(container, feat))
+    assert(os.access(os.path.join(container, "ext", "a"), os.X_OK))
+    assert(not os.path.exists(os.path.join(container, "ext", "d", "gone")))
+    assert(git("config", "--file", gitrepo_file, "subrepo.branch") == "feat")
+    assert(git("config", "--file", gitrepo_file, "subrepo.commit") == feat)
+    with open(gitrepo_file, 'r') as f:
+        assert(f"parent = {git('-C', container, 'rev-parse', 'HEAD')}" in f.read())
+    fp_git.checkout_feature("master")
+    assert(_subrepo_matches(container, sha))
+    assert(not os.access(os.path.join(container, "ext", "a"), os.X_OK))
+    assert(git("config", "--file", gitrepo_file, "subrepo.commit") == sha)
+    # local changes in the subrepo have to be cloned over
+    write(os.path.join(container, "ext", "a"), b"local\n")
+    monkeypatch.chdir(container)
+    assert(not fp_git._switch_feature_incrementally("feat"))
+    assert(git("config", "--file", gitrepo_file, "subrepo.commit") == sha)
+
+
+def test_incremental_switch_to_current_branch(scratch_subrepo, git):
+    (feature, container, sha) = scratch_subrepo
+    head = git("-C", container, "rev-parse", "HEAD")
+    # nothing to apply and nothing to record, the switch neither commits nor exits
+    fp_git.checkout_feature("master")
+    assert(git("-C", container, "rev-parse", "HEAD") == head)
+    assert(_subrepo_matches(container, sha))
+    assert(git("config", "--file", os.path.join(container, "ext", ".gitrepo"), "subrepo.commit") == sha)
+    assert(git("-C", container, "status", "--porcelain") == "")
+
+
+def _sparse_container(patch_settings, git, write):
+    """
+    A container with the android roots of the patch settings, an additional extraction file whose name holds
+    gitignore wildcards and a file outside of all of them.
+    :return: (container root, paths relative to it)
+    """
+    (container, main, feature) = patch_settings
+    files = {name: os.path.join(container, name) for name in
+             ("app/src/main/AndroidManifest.xml", "app/src/main/java/A.java", "app/src/main/java/ext/b",
+              "app/src/main/res/values/v.xml", "docs/a*[1].txt", "docs/ab1.txt", "other/big")}
+    for path in files.values():
+        write(path, "x\n")
+    _inject_config(dict(configuration(), additional_extraction_file_paths=[files["docs/a*[1].txt"]]))
+    git("init", "-q", "-b", "main", container)
+    git("-C", container, "add", "-A")
+    git("-C", container, "commit", "-qm", "container")
+    return container, files
+
+
+def test_sparse_checkout(patch_settings, git, write):
+    (container, files) = _sparse_container(patch_settings, git, write)
+    _inject_constants(dict(constants(), sparse_checkout=True))
+    fp_git.update_sparse_checkout()
+    assert(git("-C", container, "sparse-checkout", "list").splitlines() ==
+           ["/app/src/main/java/", "/app/src/main/res/layout/", "/app/src/main/res/drawable/",
+            "/app/src/main/res/values/", "/app/src/main/java/ext/", "/app/src/main/AndroidManifest.xml", "/docs/a\\*\\[1].txt"])
+    # the escaped wildcards only match the additional file itself
+    checked_out = {name for (name, path) in files.items() if os.path.isfile(path)}
+    assert(checked_out == set(files) - {"docs/ab1.txt", "other/big"})
+    # disabling restores the full working tree
+    _inject_constants(dict(constants(), sparse_checkout=False))
+    fp_git.update_sparse_checkout()
+    assert(all(os.path.isfile(path) for path in files.values()))
+    assert(git("-C", container, "config", "--bool", "--default", "false", "core.sparseCheckout") == "false")
+
+
+def test_sparse_checkout_of_the_user(patch_settings, git, write):
+    (container, files) = _sparse_container(patch_settings, git, write)
+    git("-C", container, "sparse-checkout", "set", "--no-cone", "/other/")
+    # a sparse checkout feature-patch did not set up is left alone
+    fp_git.update_sparse_checkout()
+    assert(git("-C", container, "sparse-checkout", "list") == "/other/")
+    assert({name for (name, path) in files.items() if os.path.isfile(path)} == {"other/big"})
+
+
+def _fetch_scratch(tmp_path, monkeypatch, git, write):
+    """
+    An empty container (the working directory) with two remotes, 'empty' has nothing, 'upstream' has the tags v1
+    and v2 and a branch 'other'.
+    :return: container root
+    """
+    root = str(tmp_path)
+    (upstream, container) = (os.path.join(root, "upstream"), os.path.join(root, "fetching"))
+    git("init", "-q", "--bare", os.path.join(root, "empty.git"))
+    git("init", "-q", "-b", "main", upstream)
+    git("-C", upstream, "config", "uploadpack.allowFilter", "true")
+    for version in ("v1", "v2"):
+        write(os.path.join(upstream, "file"), f"{version}\n")
+        git("-C", upstream, "add", "-A")
+        git("-C", upstream, "commit", "-qm", version)
+        git("-C", upstream, "tag", "-a", "-m", version, version)
+    git("-C", upstream, "checkout", "-qb", "other")
+    git("-C", upstream, "commit", "-q", "--allow-empty", "-m", "other")
+    git("init", "-q", "-b", "main", container)
+    git("-C", container, "remote", "add", "empty", os.path.join(root, "empty.git"))
+    git("-C", container, "remote", "add", "upstream", upstream)
+    monkeypatch.chdir(container)
+    return container
+
+
+def _refs(container: str, git):
+    return set(git("-C", container, "for-each-ref", "--format=%(refname)").splitlines())
+
+
+def _missing_objects(container: str, tag: str, git):
+    return [line for line in git("-C", container, "rev-list", "--objects", "--missing=print", tag).splitlines()
+            if line.startswith("?")]
+
+
+def test_fetch_tag_all(tmp_path, monkeypatch, patch_settings, git, write):
+    container = _fetch_scratch(tmp_path, monkeypatch, git, write)
+    _inject_constants(dict(constants(), container_fetch_mode="all"))
+    fp_git._fetch_tag("v2")
+    # every branch and tag of every remote
+    assert(_refs(container, git) == {"refs/tags/v1", "refs/tags/v2", "refs/remotes/upstream/main",
+                                     "refs/remotes/upstream/other"})
+    assert(_missing_objects(container, "v2", git) == [])
+
+
+def test_fetch_tag_targeted(tmp_path, monkeypatch, patch_settings, git, write):
+    container = _fetch_scratch(tmp_path, monkeypatch, git, write)
+    _inject_constants(dict(constants(), container_fetch_mode="targeted"))
+    fp_git._fetch_tag("v2")
+    # only the tag, from the remote that has it, with its complete history
+    assert(_refs(container, git) == {"refs/tags/v2"})
+    assert(git("-C", container, "rev-list", "--count", "v2") == "2")
+    assert(_missing_objects(container, "v2", git) == [])
+
+
+def test_fetch_tag_partial(tmp_path, monkeypatch, patch_settings, git, write):
+    container = _fetch_scratch(tmp_path, monkeypatch, git, write)
+    _inject_constants(dict(constants(), container_fetch_mode="partial"))
+    fp_git._fetch_tag("v2")
+    # the tag and its commits and trees, the blobs are left to the promisor remote
+    assert(_refs(container, git) == {"refs/tags/v2"})
+    assert(git("-C", container, "rev-list", "--count", "v2") == "2")
+    assert(len(_missing_objects(container, "v2", git)) == 2)
+    assert(git("-C", container, "config", "remote.upstream.promisor") == "true")
+    # checking out fetches the blobs lazily
+    git("-C", container, "checkout", "-q", "v2")
+    assert(git("-C", container, "show", "HEAD:file") == "v2")
+
+
+def test_stage_files_literally(patch_settings, git, write):
+    (container, main, feature) = patch_settings
+    (wildcard, matched) = (os.path.join(main, "java", "a*.java"), os.path.join(main, "java", "ab.java"))
+    for path in (wildcard, matched):
+        write(path, "class A {}\n")
+    git("init", "-q", "-b", "main", container)
+    git("-C", container, "add", "-A")
+    git("-C", container, "commit", "-qm", "container")
+    for path in (wildcard, matched):
+        write(path, "class B {}\n")
+    fp_git.stage_files([wildcard])
+    # the file name is no glob, the file it would match stays unstaged
+    assert(git("-C", container, "diff", "--cached", "--name-only") == "app/src/main/java/a*.java")
+    assert(git("-C", container, "diff", "--name-only") == "app/src/main/java/ab.java")
@@ -0,0 +1,205 @@
+import os
+import signal
+import subprocess
+import sys
+from featurePatch.util import _inject_constants, constants, merge_cache_path, merge_cost_model_path
+from featurePatch import records, mergecache, costmodel
+from featurePatch import git as fp_git
+from featurePatch.android import applyFeature
+from featurePatch.android.valuesMerge import merge_values
+
+
+def test_patch_values_file(scratch_patch, monkeypatch, testcase, read):
+    paths = scratch_patch
+    calls = []
+
+    def spy(*args):
+        merged = merge_values(*args)
+        calls.append((args, merged))
+        return merged
+
+    monkeypatch.setattr(applyFeature, "merge_values", spy)
+    applyFeature.patch()
+    # the values file is merged by key against its own unmodified predecessor
+    assert(len(calls) == 1)
+    ((upstream, modified, unmodified, marker), merged) = calls[0]
+    assert(unmodified == testcase('01')['unmodified'] and merged is not None)
+    assert(read(paths["values"][1]) == merged)
+    code = testcase('04')
+    assert(read(paths["code"][1]) == applyFeature._create_diff(code['upstream'], code['_modified'], code['unmodified']))
+    assert(len(records.unprocessed_records()) == 0)
+
+
+def _killed_patch(root: str):
+    """
+    Patches the scratch container in root and gets killed right after the first merged file was written.
+    """
+    from conftest import patch_config
+    patch_config(root)
+    replace_file_content = applyFeature._replace_file_content
+
+    def replace_and_die(path: str, content: str):
+        replace_file_content(path, content)
+        os.kill(os.getpid(), signal.SIGKILL)
+
+    applyFeature._replace_file_content = replace_and_die
+    applyFeature.patch()
+
+
+def test_patch_resume_after_kill(tmp_path, scratch_patch, testcase, read):
+    root = str(tmp_path)
+    paths = scratch_patch
+    records.close_store()
+    tests = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.run([sys.executable, "-c", f"import sys; sys.path[:0] = [{os.path.dirname(tests)!r}, "
+                                                    f"{tests!r}]; import test_patch; test_patch._killed_patch({root!r})"],
+                             capture_output=True)
+    assert(process.returncode == -signal.SIGKILL)
+    # the merges are written in record order, only the values file was written
+    merged_once = read(paths["values"][1])
+    assert(merged_once != testcase('01')['upstream'] and read(paths["code"][1]) == testcase('04')['upstream'])
+    # the journal replay recognizes the written file as merged
+    records.prepare_patch()
+    assert(not os.path.isfile(os.path.join(root, "work", "patch_journal.jsonl")))
+    assert([r["match"] for r in records.unprocessed_records()] == [paths["code"][1]])
+    applyFeature.patch()
+    assert(read(paths["values"][1]) == merged_once)
+    assert(len(records.unprocessed_records()) == 0)
+
+
+def test_patch_isolates_failures(scratch_patch, marker, testcase, read, write):
+    paths = scratch_patch
+    # a container file that is not on the unmodified branch
+    feature = os.path.dirname(os.path.dirname(os.path.dirname(paths["code"][0])))
+    new_file = os.path.join(os.path.dirname(paths["code"][1]), "New.java")
+    write(new_file, "class New {}\n")
+    contact_point = os.path.join(feature, "contactPoints", "code", "New.java")
+    write(contact_point, f"class New {{\n// {marker} start\n// {marker} end\n}}\n")
+    records.reset_store()
+    for (cp, match) in [paths["values"], (contact_point, new_file), paths["code"]]:
+        records.add_record(cp, match)
+    records.commit()
+    records.export_json()
+    try:
+        applyFeature.patch()
+        assert(False)
+    except SystemExit as e:
+        assert(e.code == 1)
+    assert([r["match"] for r in records.unprocessed_records()] == [])
+    errors = records._store().execute("SELECT contact_point, message FROM errors").fetchall()
+    assert(len(errors) == 1 and errors[0]["contact_point"] == new_file
+           and errors[0]["message"].startswith("Traceback (most recent call last):\n")
+           and "MissingUnmodifiedFileError: unmodified_v1:" in errors[0]["message"])
+    assert(read(paths["values"][1]) != testcase('01')['upstream'])
+    assert(read(new_file) == "class New {}\n")
+
+
+def test_patch_copies_unchanged_files(scratch_patch, monkeypatch, read):
+    paths = scratch_patch
+    assert(fp_git.unchanged_upstream_files() >= {paths["layout"][1]})
+    assert(not fp_git.unchanged_upstream_files() & {paths["values"][1], paths["code"][1]})
+    merged = []
+    merge_contents = applyFeature._merge_contents
+
+    def spy(*args):
+        merged.append(args[4])
+        return merge_contents(*args)
+
+    monkeypatch.setattr(applyFeature, "_merge_contents", spy)
+    applyFeature.patch()
+    # the layout did not change upstream, the contact point is copied as is, the others are merged
+    assert(read(paths["layout"][1]) == read(paths["layout"][0]))
+    assert(sorted(merged) == sorted([paths["values"][0], paths["code"][0]]))
+    assert(len(records.unprocessed_records()) == 0)
+
+
+def test_merge_cache(tmp_path, patch_settings, testcase):
+    code = testcase('04')
+    arguments = (code['upstream'], code['_modified'], code['unmodified'], None, "AttachmentKeyboard.java")
+    mergecache.open_cache()
+    try:
+        (merged, fallbacks, cached) = applyFeature._merge_contents(*arguments)
+        assert(not cached and fallbacks == [])
+        # the same inputs hit the cache
+        assert(applyFeature._merge_contents(*arguments) == (merged, [], True))
+        # changed inputs miss it
+        upstream = code['upstream'].replace("import", "import ", 1)
+        assert(not applyFeature._merge_contents(upstream, *arguments[1:])[2])
+        # and so do changed settings that influence the result
+        _inject_constants(dict(constants(), merge_engine="diff3"))
+        assert(not applyFeature._merge_contents(*arguments)[2])
+    finally:
+        mergecache.close_cache()
+    # three merged texts and the intermediate diffs of both upstream versions (dmp only)
+    assert(len(os.listdir(merge_cache_path())) == 5)
+
+
+def test_merge_cache_eviction(tmp_path, patch_settings):
+    mergecache.open_cache()
+    keys = [mergecache.cache_key(mergecache.MERGED, [str(i)]) for i in range(6)]
+    for (i, key) in enumerate(keys):
+        mergecache.store(key, {"merged": os.urandom(2048).hex()})
+        os.utime(os.path.join(merge_cache_path(), key + ".json.gz"), (1000 + i, 1000 + i))
+    sizes = [os.path.getsize(os.path.join(merge_cache_path(), key + ".json.gz")) for key in keys]
+    # a hit makes the oldest entry the most recently used one
+    assert(mergecache.lookup(keys[0]) is not None)
+    _inject_constants(dict(constants(), merge_cache_max_mb=(sum(sizes) - sizes[1] - sizes[2] + 1) / 1024 / 1024))
+    mergecache.close_cache()
+    # the least recently used entries were evicted until the rest fits
+    assert(sorted(os.listdir(merge_cache_path())) == sorted(key + ".json.gz" for key in keys[:1] + keys[3:]))
+    # a disabled cache neither stores nor finds anything
+    assert(mergecache.cache_key(mergecache.MERGED, ["0"]) is None and mergecache.lookup(keys[0]) is None)
+
+
+def _spy_merge_order(monkeypatch):
+    """
+    :return: list of ("start" | "write", container file) events of the merges of the patch, in order
+    """
+    events = []
+    (start_merge, replace_file_content) = (applyFeature._start_merge, applyFeature._replace_file_content)
+
+    def start_spy(record, *args):
+        events.append(("start", record["match"]))
+        return start_merge(record, *args)
+
+    def replace_spy(path: str, content: str):
+        events.append(("write", path))
+        replace_file_content(path, content)
+
+    monkeypatch.setattr(applyFeature, "_start_merge", start_spy)
+    monkeypatch.setattr(applyFeature, "_replace_file_content", replace_spy)
+    return events
+
+
+def test_patch_merges_in_order(scratch_patch, monkeypatch):
+    paths = scratch_patch
+    events = _spy_merge_order(monkeypatch)
+    applyFeature.patch()
+    # a single job merges one file after the other in record order, nothing is computed ahead
+    (values, code) = (paths["values"][1], paths["code"][1])
+    assert(events == [("start", values), ("write", values), ("start", code), ("write", code)])
+    journal_order = [r["match"] for r in records._store().execute("SELECT match FROM records ORDER BY started")]
+    assert(journal_order == [paths["layout"][1], values, code])
+
+
+def test_patch_longest_merges_first(scratch_patch, monkeypatch):
+    paths = scratch_patch
+    (values, code) = (paths["values"], paths["code"])
+    (values_key, code_key) = (os.path.normpath(values[0]), os.path.normpath(code[0]))
+    work = [(values_key, [values[1], values[0]]), (code_key, [code[1], code[0]])]
+    # by size alone the values file comes first, only its recorded duration makes the java file the longest merge
+    assert(costmodel.longest_first(dict(), work) == [0, 1])
+    model = {values_key: {"seconds": 0.1, "size": 1, "lines": 1}, code_key: {"seconds": 5.0, "size": 1, "lines": 1},
+             os.path.normpath("gone.java"): {"seconds": 9.0, "size": 1, "lines": 1}}
+    assert(costmodel.longest_first(model, work) == [1, 0])
+    costmodel.save_model(model, merge_cost_model_path())
+    events = _spy_merge_order(monkeypatch)
+    applyFeature.patch(jobs=2)
+    starts = [path for (event, path) in events if event == "start"]
+    assert(starts == [code[1], values[1]])
+    assert([path for (event, path) in events if event == "write"] == starts)
+    # the timings of the run are merged into the model, the file that is not patched anymore is dropped
+    updated = costmodel.load_model(merge_cost_model_path())
+    assert(sorted(updated) == sorted([values_key, code_key]))
+    assert(updated[code_key]["seconds"] != 5.0 and updated[values_key]["seconds"] != 0.1)
+    assert(updated[code_key]["size"] > 1 and updated[values_key]["lines"] > 1)
@@ -0,0 +1,39 @@
+import json
+import os
+from featurePatch.util import runtime_record_path, error_record_path, record_store_path
+from featurePatch import records
+
+
+def _records_json():
+    with open(runtime_record_path(), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_records_round_trip(tmp_path, scratch_store):
+    root = str(tmp_path)
+    exported = _records_json()
+    assert([(r["processed"], r.get("fallback")) for r in exported] ==
+           [(True, "patience diff after 0.1s"), (False, None), (False, None)])
+    with open(error_record_path(), 'r', encoding='utf-8') as f:
+        assert(json.load(f) == [{"contact_point": "D.java", "match": "", "processed": False, "message": "no match"}])
+    # an untouched runtime record is not imported again
+    records.close_store()
+    records.prepare_patch()
+    assert([r["match"] for r in records.unprocessed_records()] == [exported[1]["match"], exported[2]["match"]])
+    # a hand edited runtime record replaces the records of the store
+    exported[1]["processed"] = True
+    exported[2]["match"] = os.path.join(root, "Other.java")
+    with open(runtime_record_path(), 'w', encoding='utf-8') as f:
+        f.write(json.dumps(exported, indent=1))
+    os.utime(runtime_record_path(), ns=(0, 0))
+    records.prepare_patch()
+    assert([r["match"] for r in records.unprocessed_records()] == [os.path.join(root, "Other.java")])
+    records.export_json()
+    assert(_records_json() == exported)
+    # a lost store is rebuilt from the runtime record
+    records.close_store()
+    os.remove(record_store_path())
+    records.prepare_patch()
+    assert(records.record_count() == 3)
+    records.export_json()
+    assert(_records_json() == exported)